@@ -0,0 +1,368 @@
+# convert_mmpr.py
+"""
+meta.json 의 MMPR annotation 을 한 번만 읽어서 SFT / DPO 출력과 seed 로 뽑은 N 개짜리 부분집합을 같이 만든다.
+(convert_conv.py / convert_dpo.py / convert_small_sft_dpo.py 는 이 스크립트를 한 가지 출력으로 부르는 wrapper)
+
+    python convert_mmpr.py                                    # sft_mmpr_llava_format.json + dpo_mmpr_llava_format.json
+    python convert_mmpr.py --subset 40000:1111 --subset 10000:42
+                                                              # + sft_mmpr_40k_1111.json / dpo_mmpr_40k_1111.json …
+    python convert_mmpr.py --no-sft --no-dpo --subset 40000:1111
+
+- 레코드마다 GIF 이름 변경, <image> 검사, 토큰 수 측정을 한 번만 한다 (SFT 와 DPO 가 같은 텍스트를 잼)
+- SFT / DPO 걸러내는 조건은 기존 스크립트 그대로 (SFT: chosen 에 "<iamge>", DPO: chosen / rejected 에 "<image>")
+- 부분집합은 convert_small_sft_dpo 와 같은 방식: 모든 레코드 번호를 random.Random(seed) 로 섞어 앞 2N 개를
+  차례로 보며 이미지가 있고 SFT / DPO 조건과 토큰 수를 모두 통과한 것을 N 개까지
+- 전체 SFT / DPO 를 안 만들 때 (--no-sft --no-dpo) 는 전체를 읽지 않는다: 파일마다 줄 수만 세서 번호를 섞고
+  뽑힌 2N 줄만 파싱하므로 메모리는 부분집합 크기에 비례 (뽑히는 레코드와 id 는 전체를 읽을 때와 같음)
+- annotation 파일은 --workers 개 프로세스가 나눠 읽고 meta.json 순서대로 합친다
+- id 는 (annotation, root, 이미지 경로, 줄 번호) 의 hash 라서 worker 수나 실행 횟수와 상관없이 같고,
+  같은 레코드는 모든 출력에서 같은 id 를 쓴다 (출력 파일도 byte 단위로 같음)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from typing import NamedTuple
+
+from jsonl_index import JsonlIndex
+from token_filter import add_token_args, iter_token_lengths, measure_text, open_token_cache
+
+# meta.json 과 같은 폴더에 두고 실행
+base_dir = os.path.dirname(__file__)
+meta_path = os.path.join(base_dir, "meta.json")
+DEFAULT_IMAGE_ROOT = "/mnt/ssd/junha/dataset"
+COUNT_CHUNK = 1 << 24
+
+# 이미지가 여러 장인 줄 후보. 문자열 안의 따옴표는 \" 로 escape 되어 있어 key 가 아니면 걸리지 않음
+_LIST_IMAGE = re.compile(rb'"image"\s*:\s*\[')
+
+
+class Record(NamedTuple):
+    """annotation 한 줄을 정리한 것. prompt 는 SFT 의 human, chosen 은 SFT 의 gpt 값과 같다."""
+
+    root: str
+    img_path: str
+    prompt: str
+    chosen: str
+    rejected: str
+    id: str
+    sft_ok: bool
+    dpo_ok: bool
+
+    def fields(self):
+        return {"prompt": self.prompt, "chosen": self.chosen, "rejected": self.rejected}
+
+    def sft(self):
+        out = {
+            "id": self.id,
+            "conversations": [
+                {"from": "human", "value": self.prompt},
+                {"from": "gpt",   "value": self.chosen}
+            ],
+            "data_source": self.root
+        }
+        if self.img_path is not None:
+            out["image"] = self.img_path
+        return out
+
+    def dpo(self):
+        out = {
+            "id": self.id,
+            "prompt": self.prompt,
+            "chosen": self.chosen,
+            "rejected": self.rejected,
+        }
+        if self.img_path is not None:
+            out["image"] = self.img_path
+        return out
+
+
+def record_hash(ann, root, img_path, line_no, digest_size):
+    """
+    (annotation, root, 이미지 경로, 줄 번호) → 16진수 문자열.
+    root 가 같은 annotation 이 여럿 있어 (cocorem_exist_yorn_* 등) annotation 경로까지 넣는다.
+    """
+    key = "\0".join((ann, root, img_path or "", str(line_no)))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=digest_size).hexdigest()
+
+
+def parse_record(item, root, prefix, ann, line_no, check_dpo=True):
+    """
+    annotation 의 item 하나 (ann 의 line_no 번째 줄, 1부터) → Record.
+    이미지가 여러 장이면 None (호출 쪽에서 파일 나머지를 건너뜀).
+    check_dpo: 이미지 없는 item 의 chosen / rejected 에 <image> 가 있으면 AssertionError (convert_dpo 와 같음)
+    """
+    if "image" not in item.keys():
+        if check_dpo:
+            assert "<image>" not in item.get("chosen", ""), f"<image> found in {item.get('chosen', '')}"
+            assert "<image>" not in item.get("rejected", ""), f"<image> found in {item.get('rejected', '')}"
+        _id = record_hash(ann, root, None, line_no, 8)
+        print(f"{_id} has no image, using hashed ID")
+        return Record(root, None, item.get("question", ""), item.get("chosen", ""), item.get("rejected", ""),
+                      _id, True, True)
+
+    rel_img = item["image"]
+    if isinstance(rel_img, list):
+        return None
+
+    if rel_img.endswith('.gif'):
+        rel_img = rel_img[:-4] + '.jpg'
+    assert rel_img.endswith(('.jpg', '.jpeg', '.png')), f"Invalid image format: {rel_img}"
+    img_path = os.path.join(prefix, rel_img)
+
+    parent = os.path.basename(os.path.dirname(img_path))
+    fname = os.path.splitext(os.path.basename(img_path))[0]
+    # 같은 이미지를 여러 줄이 쓰므로 5자리 난수 대신 더 긴 hash 로 겹치지 않게 함
+    _id = f"{parent}-{fname}-{record_hash(ann, root, img_path, line_no, 6)}" if parent else fname
+
+    # check human value
+    prompt = item.get("question", "")
+    if "<image>" not in prompt:
+        prompt = f"<image>\n{prompt}"
+
+    chosen = item.get("chosen", "")
+    rejected = item.get("rejected", "")
+    sft_ok = "<iamge>" not in chosen
+    dpo_ok = "<image>" not in chosen
+    if dpo_ok and "<image>" in rejected:
+        if check_dpo:
+            print(f"<image> found in rejected {rejected}, skipping...")
+        dpo_ok = False
+    return Record(root, img_path, prompt, chosen, rejected, _id, sft_ok, dpo_ok)
+
+
+def read_annotation(ann, root, check_dpo=True):
+    """annotation 파일 하나 → Record 리스트 (worker 프로세스에서 파일 단위로 실행)."""
+    prefix = os.path.join("MMPR-v1.2", root)
+    print(f"Processing {ann} ...")
+
+    records = []
+    with open(os.path.join(base_dir, ann), encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            rec = parse_record(json.loads(line), root, prefix, ann, line_no, check_dpo)
+            if rec is None:
+                print(f"Skipping entire file {ann} ...")
+                break
+            records.append(rec)
+    return records
+
+
+def read_records(meta, workers=1, check_dpo=True):
+    """
+    meta.json 의 annotation 을 한 번씩 읽어 Record 리스트를 만든다.
+    workers > 1 이면 파일마다 프로세스에 나눠 읽고, 결과는 항상 meta.json 순서로 이어 붙인다.
+    """
+    jobs = [(info["annotation"], info["root"], check_dpo) for info in meta.values()]
+    records = []
+    for part in _map_jobs(read_annotation, jobs, workers):
+        records.extend(part)
+
+    n_ids = len({rec.id for rec in records})
+    if n_ids != len(records):
+        print(f"[WARN] {len(records) - n_ids} duplicate ids")
+    return records
+
+
+def _map_jobs(fn, jobs, workers):
+    """fn(*job) 을 jobs 순서대로 돌려준다 (workers > 1 이면 파일 단위로 프로세스에 나눔)."""
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [pool.submit(fn, *job) for job in jobs]
+            return [fut.result() for fut in futures]
+    return [fn(*job) for job in jobs]
+
+
+def _is_list_image(line):
+    return isinstance(json.loads(line).get("image"), list)
+
+
+def count_records(ann):
+    """
+    read_annotation 이 ann 에서 만들 Record 수 (= 이미지가 여러 장인 첫 줄 앞까지의 줄 수).
+    json 을 파싱하지 않고 줄바꿈만 세고, '"image": [' 가 보이는 줄만 파싱해서 확인한다.
+    """
+    n = 0
+    tail = b""
+    with open(os.path.join(base_dir, ann), "rb") as f:
+        while chunk := f.read(COUNT_CHUNK):
+            buf = tail + chunk
+            cut = buf.rfind(b"\n") + 1
+            body, tail = buf[:cut], buf[cut:]
+            m = _LIST_IMAGE.search(body)
+            while m:
+                start = body.rfind(b"\n", 0, m.start()) + 1
+                end = body.find(b"\n", m.end())
+                if _is_list_image(body[start:end]):
+                    return n + body.count(b"\n", 0, start)
+                m = _LIST_IMAGE.search(body, end)
+            n += body.count(b"\n")
+    if tail.strip() and not (_LIST_IMAGE.search(tail) and _is_list_image(tail)):
+        n += 1
+    return n
+
+
+def read_annotation_lines(ann, root, line_nos, check_dpo=True):
+    """
+    ann 에서 line_nos (1부터) 줄만 Record 로 만든다 → {줄 번호: Record}.
+    jsonl_index 의 줄 인덱스로 그 줄만 읽는다 (인덱스는 처음 한 번 만들어 캐시에 둠).
+    """
+    prefix = os.path.join("MMPR-v1.2", root)
+    out = {}
+    with JsonlIndex(os.path.join(base_dir, ann)) as idx:
+        for line_no in sorted(line_nos):
+            item = json.loads(idx.line_bytes(line_no - 1))
+            out[line_no] = parse_record(item, root, prefix, ann, line_no, check_dpo)
+    return out
+
+
+def count_all(meta, workers=1):
+    """meta.json 의 annotation 마다 (annotation, root, Record 수)."""
+    jobs = [(info["annotation"], info["root"]) for info in meta.values()]
+    counts = _map_jobs(count_records, [(ann,) for ann, _ in jobs], workers)
+    return [(ann, root, n) for (ann, root), n in zip(jobs, counts)]
+
+
+def subset_order(total, size, seed):
+    """0 .. total-1 을 random.Random(seed) 로 섞은 앞 2 * size 개 (list 대신 array 로 섞어도 결과는 같음)."""
+    order = array("Q", range(total))
+    random.Random(seed).shuffle(order)
+    return order[:size * 2]
+
+
+def sample_records(files, size, seed, workers=1, check_dpo=True):
+    """
+    files: count_all 결과. 전체를 읽었을 때의 번호로 subset_order 를 정하고 뽑힌 줄만 읽는다.
+    → (order, {번호: Record}) — pick_subset 에 그대로 넘김
+    """
+    starts = [0]
+    for _, _, n in files:
+        starts.append(starts[-1] + n)
+    order = subset_order(starts[-1], size, seed)
+    print(f"Total items: {starts[-1]}, reading {len(order)} sampled lines")
+
+    by_file = defaultdict(list)
+    for g in order:
+        i = bisect_right(starts, g) - 1
+        by_file[i].append(g - starts[i] + 1)
+    jobs = [(files[i][0], files[i][1], line_nos, check_dpo) for i, line_nos in sorted(by_file.items())]
+    records = {}
+    for i, part in zip(sorted(by_file), _map_jobs(read_annotation_lines, jobs, workers)):
+        records.update((starts[i] + line_no - 1, rec) for line_no, rec in part.items())
+    return order, records
+
+
+def parse_subset(spec):
+    """"40000:1111" → (40000, 1111)"""
+    size, _, seed = spec.partition(":")
+    try:
+        return int(size), int(seed)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected SIZE:SEED, got {spec!r}")
+
+
+def size_suffix(n):
+    """40000 → "40k" (convert_small_sft_dpo 의 SUFFIX 와 같은 모양)"""
+    return f"{n // 1000}k" if n % 1000 == 0 else str(n)
+
+
+def pick_subset(records, order, size, image_root, max_tokens, lengths_of):
+    """
+    convert_small_sft_dpo 와 같은 규칙으로 부분집합을 고른다.
+    records: 번호 → Record (list 또는 sample_records 의 dict), order: subset_order 의 번호들.
+    lengths_of(번호 iterable) 는 (번호, 토큰 수) 를 순서대로 yield (필요한 만큼만 당겨 감).
+    """
+    def candidates():
+        for g in order:
+            rec = records[g]
+            if rec.img_path is not None and not os.path.exists(os.path.join(image_root, rec.img_path)):
+                print("Image file does not exist, skipping...")
+                print(f"Path: {os.path.join(image_root, rec.img_path)}")
+                continue
+            if rec.sft_ok and rec.dpo_ok:
+                yield g
+
+    picked = []
+    with closing(lengths_of(candidates())) as measured:
+        for g, n_tokens in measured:
+            if n_tokens > max_tokens:
+                print("Skipping due to token limit exceeded")
+                continue
+            picked.append(records[g])
+            if len(picked) >= size:
+                break
+    return picked
+
+
+def save_json(results, path):
+    with open(path, "w", encoding="utf-8") as wf:
+        json.dump(results, wf, ensure_ascii=False, indent=2)
+    print(f"Saved {len(results)} items to {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MMPR annotation 을 한 번 읽어 SFT / DPO / 부분집합 출력을 같이 만듭니다.")
+    parser.add_argument("--no-sft", action="store_true", help="sft_mmpr_llava_format.json 을 만들지 않음")
+    parser.add_argument("--no-dpo", action="store_true", help="dpo_mmpr_llava_format.json 을 만들지 않음")
+    parser.add_argument("--subset", type=parse_subset, action="append", default=[], metavar="SIZE:SEED",
+                        help="seed 로 뽑은 SIZE 개 SFT / DPO 부분집합 (여러 번 지정 가능)")
+    parser.add_argument("--image-root", default=DEFAULT_IMAGE_ROOT, help="부분집합에서 이미지 존재를 확인할 기준 폴더")
+    add_token_args(parser)
+    args = parser.parse_args(argv)
+
+    meta = json.load(open(meta_path, encoding="utf-8"))
+    check_dpo = not args.no_dpo or bool(args.subset)
+    full = not (args.no_sft and args.no_dpo)
+    if full:
+        records = read_records(meta, args.workers, check_dpo)
+        print(f"Total items loaded: {len(records)}")
+    else:
+        files = count_all(meta, args.workers)
+
+    with open_token_cache(args) as cache:
+        def lengths_of(records, indices):
+            pairs = ((g, measure_text(records[g].fields(), args.measure)) for g in indices)
+            return iter_token_lengths(pairs, args.tokenizer, args.batch_size, args.workers, cache)
+
+        # 1) 전체 SFT / DPO: 둘 중 하나라도 남길 레코드만 한 번씩 잰다
+        lengths = {}
+        if full:
+            want = (g for g, rec in enumerate(records)
+                    if (not args.no_sft and rec.sft_ok) or (not args.no_dpo and rec.dpo_ok))
+            lengths = dict(lengths_of(records, want))
+            if not args.no_sft:
+                save_json([rec.sft() for g, rec in enumerate(records)
+                           if rec.sft_ok and lengths[g] <= args.max_tokens],
+                          os.path.join(base_dir, "sft_mmpr_llava_format.json"))
+            if not args.no_dpo:
+                save_json([rec.dpo() for g, rec in enumerate(records)
+                           if rec.dpo_ok and lengths[g] <= args.max_tokens],
+                          os.path.join(base_dir, "dpo_mmpr_llava_format.json"))
+
+        # 2) 부분집합: 후보는 SFT / DPO 를 모두 통과해야 하므로 위에서 이미 잰 것
+        #    (전체를 안 만들었으면 뽑힌 줄만 읽어 필요한 만큼만 잼)
+        for size, seed in args.subset:
+            if full:
+                picked = pick_subset(records, subset_order(len(records), size, seed), size, args.image_root,
+                                     args.max_tokens, lambda indices: ((g, lengths[g]) for g in indices))
+            else:
+                order, sampled = sample_records(files, size, seed, args.workers, check_dpo)
+                picked = pick_subset(sampled, order, size, args.image_root, args.max_tokens,
+                                     lambda indices: lengths_of(sampled, indices))
+            suffix = size_suffix(size)
+            save_json([rec.sft() for rec in picked], os.path.join(base_dir, f"sft_mmpr_{suffix}_{seed}.json"))
+            save_json([rec.dpo() for rec in picked], os.path.join(base_dir, f"dpo_mmpr_{suffix}_{seed}.json"))
+
+    if cache is not None:
+        print(f"[CACHE] token lengths: {cache.hits:,} cached, {cache.misses:,} tokenized")
+
+
+if __name__ == "__main__":
+    main()
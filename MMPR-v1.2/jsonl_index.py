@@ -0,0 +1,256 @@
+# jsonl_index.py
+"""
+MMPR annotations/*.jsonl 의 줄 시작 위치 인덱스. 파일을 처음부터 끝까지 읽지 않고
+N 번째 줄만 읽거나, 줄 범위를 자르거나, worker 수만큼 byte 크기가 비슷한 조각으로 나눌 수 있다.
+
+    idx = JsonlIndex("annotations/foo.jsonl")   # 캐시된 인덱스가 없거나 원본이 바뀌었으면 새로 만듦
+    len(idx)                                     # 줄 수
+    idx[12345]                                   # 12345 번째 줄 (0부터) 을 json.loads 한 것
+    idx[100:200]                                 # 줄 범위 → list
+    for line_no, raw in idx.iter_lines(100, 200): ...   # 원문 bytes (줄바꿈 제외)
+    for start, stop in idx.chunks(8): ...        # byte 기준으로 고르게 나눈 줄 범위 8 개
+
+    python jsonl_index.py build meta.json              # meta.json 의 annotation 전부 (또는 .jsonl 여러 개)
+    python jsonl_index.py show annotations/foo.jsonl 12346 --count 3   # 줄 번호는 sed -n 처럼 1부터
+    python jsonl_index.py chunks annotations/foo.jsonl 8
+
+- 인덱스 파일 = 헤더 (magic, 원본 size, mtime_ns, 줄 수) + uint64 줄 시작 위치 (줄 수 + 1 개, 마지막은 파일 끝)
+- ~/.cache/llava-ov-data/jsonl_index/ 아래에 둔다 (OV_DATA_CACHE_DIR 로 폴더 변경). 원본의 size / mtime 이
+  헤더와 다르면 다시 만든다.
+- 줄은 파일의 물리적인 줄 (for line in f 와 같은 번호). 마지막 줄에 줄바꿈이 없어도 한 줄로 센다.
+- 읽기는 pread 만 쓰므로 fork 된 worker 에서 같이 써도 되고, pickle 해서 worker 에 넘겨도 된다 (파일 핸들은 빼고).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+MAGIC = b"JSONLIX1"
+HEADER = struct.Struct("<8sQQQ")  # magic, 원본 size, 원본 mtime_ns, 줄 수
+BUILD_CHUNK = 1 << 24
+
+
+def default_index_path(jsonl_path):
+    """~/.cache/llava-ov-data/jsonl_index/{파일 이름}-{절대 경로 해시}.idx (OV_DATA_CACHE_DIR 로 폴더 변경)"""
+    cache_dir = os.environ.get("OV_DATA_CACHE_DIR",
+                               os.path.join(os.path.expanduser("~"), ".cache", "llava-ov-data"))
+    abspath = os.path.abspath(jsonl_path)
+    digest = hashlib.blake2b(abspath.encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, "jsonl_index", f"{os.path.basename(abspath)}-{digest}.idx")
+
+
+def scan_offsets(jsonl_path):
+    """jsonl_path 의 줄 시작 위치 (+ 파일 끝) 를 array("Q") 로."""
+    offsets = array("Q", [0])
+    pos = 0
+    with open(jsonl_path, "rb") as f:
+        while chunk := f.read(BUILD_CHUNK):
+            i = chunk.find(b"\n")
+            while i != -1:
+                offsets.append(pos + i + 1)
+                i = chunk.find(b"\n", i + 1)
+            pos += len(chunk)
+    if offsets[-1] != pos:
+        offsets.append(pos)
+    return offsets
+
+
+def _read_index(index_path, st):
+    """캐시된 인덱스의 offsets. 없거나 원본 (st) 과 맞지 않으면 None."""
+    try:
+        with open(index_path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return None
+            magic, size, mtime_ns, n = HEADER.unpack(header)
+            if magic != MAGIC or (size, mtime_ns) != (st.st_size, st.st_mtime_ns):
+                return None
+            offsets = array("Q")
+            offsets.fromfile(f, n + 1)
+    except (FileNotFoundError, EOFError):
+        return None
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return offsets
+
+
+def _write_index(index_path, st, offsets):
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp = f"{index_path}.{os.getpid()}.tmp"
+    out = array("Q", offsets)
+    if sys.byteorder != "little":
+        out.byteswap()
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, st.st_size, st.st_mtime_ns, len(offsets) - 1))
+        out.tofile(f)
+    os.replace(tmp, index_path)
+
+
+class JsonlIndex:
+    """
+    jsonl 파일 하나의 줄 인덱스. 줄 번호는 0부터 (CLI 만 1부터).
+
+    index_path: 인덱스 캐시 파일 (기본: default_index_path). False 면 파일 없이 메모리에만 만듦.
+    rebuild: 캐시가 맞아도 다시 스캔
+    """
+
+    def __init__(self, jsonl_path, index_path=None, rebuild=False):
+        self.jsonl_path = jsonl_path
+        self.index_path = default_index_path(jsonl_path) if index_path is None else index_path
+        self.built = False
+        self._fd = None
+
+        st = os.stat(jsonl_path)
+        offsets = None
+        if self.index_path and not rebuild:
+            offsets = _read_index(self.index_path, st)
+        if offsets is None:
+            offsets = scan_offsets(jsonl_path)
+            self.built = True
+            after = os.stat(jsonl_path)
+            if (after.st_size, after.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                raise ValueError(f"{jsonl_path} changed while it was being indexed")
+            if self.index_path:
+                try:
+                    _write_index(self.index_path, st, offsets)
+                except OSError as e:
+                    print(f"[WARN] cannot write {self.index_path} ({e}), keeping the index in memory")
+        self.offsets = offsets
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_fd"] = None
+        return state
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _pread(self, start, stop):
+        if self._fd is None:
+            self._fd = os.open(self.jsonl_path, os.O_RDONLY)
+        return os.pread(self._fd, stop - start, start)
+
+    def _line_range(self, start, stop):
+        n = len(self)
+        start, stop, _ = slice(start, stop).indices(n)
+        return start, max(start, stop)
+
+    def line_bytes(self, i):
+        """i 번째 줄의 원문 bytes (줄바꿈 제외). 음수면 뒤에서부터."""
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(f"line {i} out of range for {self.jsonl_path} ({n} lines)")
+        return self._pread(self.offsets[i], self.offsets[i + 1]).rstrip(b"\r\n")
+
+    def iter_lines(self, start=0, stop=None, read_size=BUILD_CHUNK):
+        """[start, stop) 줄의 (줄 번호, 원문 bytes) 를 차례로. read_size 씩 이어서 읽는다."""
+        start, stop = self._line_range(start, stop)
+        i = start
+        while i < stop:
+            # read_size 안에 들어오는 줄까지 한 번에 (줄 하나가 더 길면 그 줄만)
+            j = max(bisect_right(self.offsets, self.offsets[i] + read_size, i + 1, stop + 1) - 1, i + 1)
+            base = self.offsets[i]
+            buf = self._pread(base, self.offsets[j])
+            for k in range(i, j):
+                yield k, buf[self.offsets[k] - base:self.offsets[k + 1] - base].rstrip(b"\r\n")
+            i = j
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                return [json.loads(self.line_bytes(i)) for i in range(*key.indices(len(self)))]
+            return [json.loads(raw) for _, raw in self.iter_lines(key.start, key.stop)]
+        return json.loads(self.line_bytes(key))
+
+    def chunks(self, n):
+        """
+        파일을 byte 크기가 비슷한 줄 범위 n 개로 나눈다 → [(start, stop), ...] (빈 범위는 뺌).
+        범위 경계는 항상 줄 경계라 worker 마다 iter_lines(start, stop) 으로 읽으면 된다.
+        """
+        total = self.offsets[-1]
+        bounds = [0]
+        for k in range(1, n):
+            cut = bisect_left(self.offsets, total * k // n, bounds[-1], len(self))
+            bounds.append(max(cut, bounds[-1]))
+        bounds.append(len(self))
+        return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+
+def expand_inputs(paths):
+    """meta.json 이면 그 안의 annotation 경로들, 아니면 그대로."""
+    out = []
+    for path in paths:
+        if path.endswith(".json"):
+            with open(path, encoding="utf-8") as f:
+                meta = json.load(f)
+            base = os.path.dirname(path)
+            out.extend(os.path.join(base, info["annotation"]) for info in meta.values())
+        else:
+            out.append(path)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="jsonl 줄 시작 위치 인덱스를 만들고 줄을 바로 읽습니다.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="인덱스를 만들어 캐시에 저장 (meta.json 또는 .jsonl)")
+    p_build.add_argument("paths", nargs="+")
+    p_build.add_argument("--rebuild", action="store_true", help="캐시가 맞아도 다시 스캔")
+
+    p_show = sub.add_parser("show", help="LINE 번째 줄부터 출력 (1부터)")
+    p_show.add_argument("path")
+    p_show.add_argument("line", type=int)
+    p_show.add_argument("--count", type=int, default=1)
+    p_show.add_argument("--pretty", action="store_true", help="json indent=2 로 출력")
+
+    p_chunks = sub.add_parser("chunks", help="byte 크기가 비슷한 줄 범위 N 개 출력 (1부터, 끝 포함)")
+    p_chunks.add_argument("path")
+    p_chunks.add_argument("n", type=int)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        for path in expand_inputs(args.paths):
+            if not os.path.exists(path):
+                print(f"[SKIP] {path} (not found)")
+                continue
+            idx = JsonlIndex(path, rebuild=args.rebuild)
+            tag = "DONE" if idx.built else "CACHE"
+            print(f"[{tag}] {path}: {len(idx):,} lines → {idx.index_path}")
+            idx.close()
+    elif args.command == "show":
+        with JsonlIndex(args.path) as idx:
+            for _, raw in idx.iter_lines(args.line - 1, args.line - 1 + args.count):
+                text = raw.decode("utf-8")
+                print(json.dumps(json.loads(text), ensure_ascii=False, indent=2) if args.pretty else text)
+    elif args.command == "chunks":
+        with JsonlIndex(args.path) as idx:
+            for start, stop in idx.chunks(args.n):
+                size = idx.offsets[stop] - idx.offsets[start]
+                print(f"{start + 1}-{stop}\t{stop - start:,} lines\t{size:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
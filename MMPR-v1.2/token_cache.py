@@ -0,0 +1,139 @@
+# token_cache.py
+"""
+텍스트별 토큰 수를 디스크에 기억해 두는 캐시 (token_filter.iter_token_lengths 에서 사용).
+
+같은 MMPR 문자열을 --max-tokens 만 바꿔 다시 돌릴 때마다 처음부터 토크나이즈하지 않도록,
+(토크나이저, 텍스트 해시) → 토큰 수 를 크기가 고정된 파일에 mmap 으로 저장한다.
+
+    with TokenLengthCache(default_token_cache_path(name, tokenizer_fingerprint(tok))) as cache:
+        key = cache.key(text)
+        n = cache.get(key)
+        if n is None:
+            n = len(tok.encode(text, add_special_tokens=False))
+            cache.put(key, n)
+
+- 토크나이저마다 파일이 따로 있다 (이름 + vocab/설정 해시로 파일 이름을 정함 → 같은 이름의 다른 revision 도 구분)
+- 파일 = 헤더 + bucket 배열. bucket 하나에 WAYS 개의 (텍스트 해시 64bit, 마지막 사용 epoch << 32 | 토큰 수)
+- 크기는 max_bytes 로 고정. bucket 이 차면 가장 오래 안 쓴 (epoch 이 작은) 칸을 덮어쓴다.
+  epoch 은 캐시를 열 때마다 1 씩 오른다 (= 실행 단위 LRU).
+- 쓰는 동안 헤더에 dirty 를 켜 두고 close() 에서 끈다. 중간에 죽어 dirty 로 남은 파일은 다음에 비우고 시작.
+- 한 번에 한 프로세스만 연다 (flock). 이미 누가 쓰고 있으면 BlockingIOError.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+
+MAGIC = b"TOKLEN01"
+HEADER = struct.Struct("<8sQIII4x")  # magic, bucket 수, ways, epoch, dirty
+WAYS = 8
+SLOT_BYTES = 16
+DEFAULT_CACHE_BYTES = 256 << 20  # 1600만 개 정도
+
+_LEN_MASK = 0xFFFFFFFF
+
+
+def default_token_cache_path(tokenizer_name, fingerprint):
+    """~/.cache/llava-ov-data/token_lengths/{토크나이저 이름}-{fingerprint}.bin (OV_DATA_CACHE_DIR 로 폴더 변경)"""
+    cache_dir = os.environ.get("OV_DATA_CACHE_DIR",
+                               os.path.join(os.path.expanduser("~"), ".cache", "llava-ov-data"))
+    safe = tokenizer_name.strip("/").replace("/", "--")
+    return os.path.join(cache_dir, "token_lengths", f"{safe}-{fingerprint}.bin")
+
+
+def tokenizer_fingerprint(tokenizer):
+    """vocab / merges / normalizer 까지 담긴 fast tokenizer 직렬화의 해시 (없으면 이름)."""
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    data = backend.to_str() if backend is not None else tokenizer.name_or_path
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class TokenLengthCache:
+    """
+    path:      캐시 파일 (없으면 만듦)
+    max_bytes: 파일 크기. 기존 파일과 크기가 다르면 비우고 새로 만든다.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_CACHE_BYTES):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.n_buckets = max(1, (max_bytes - HEADER.size) // (WAYS * SLOT_BYTES))
+        size = HEADER.size + self.n_buckets * WAYS * SLOT_BYTES
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._fd)
+            raise
+
+        header = os.pread(self._fd, HEADER.size, 0)
+        fresh = True
+        if len(header) == HEADER.size and os.fstat(self._fd).st_size == size:
+            magic, n_buckets, ways, epoch, dirty = HEADER.unpack(header)
+            fresh = not (magic == MAGIC and n_buckets == self.n_buckets and ways == WAYS and not dirty)
+        if fresh:
+            os.ftruncate(self._fd, 0)  # 남은 내용을 0 으로 (빈 칸)
+            os.ftruncate(self._fd, size)
+            epoch = 0
+        self.epoch = epoch + 1
+
+        self._mm = mmap.mmap(self._fd, size)
+        HEADER.pack_into(self._mm, 0, MAGIC, self.n_buckets, WAYS, self.epoch, 1)
+        self._slots = memoryview(self._mm)[HEADER.size:].cast("Q")
+
+    @staticmethod
+    def key(text):
+        k = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        return k or 1  # 0 은 빈 칸 표시
+
+    def get(self, key):
+        s = self._slots
+        base = (key % self.n_buckets) * WAYS * 2
+        for i in range(base, base + WAYS * 2, 2):
+            k = s[i]
+            if k == key:
+                meta = s[i + 1]
+                if meta >> 32 != self.epoch:
+                    s[i + 1] = (self.epoch << 32) | (meta & _LEN_MASK)
+                self.hits += 1
+                return meta & _LEN_MASK
+            if k == 0:
+                break  # bucket 은 앞에서부터 채우므로 빈 칸 뒤에는 없음
+        self.misses += 1
+        return None
+
+    def put(self, key, n_tokens):
+        s = self._slots
+        base = (key % self.n_buckets) * WAYS * 2
+        victim, oldest = base, None
+        for i in range(base, base + WAYS * 2, 2):
+            k = s[i]
+            if k == key or k == 0:
+                victim = i
+                break
+            epoch = s[i + 1] >> 32
+            if oldest is None or epoch < oldest:
+                victim, oldest = i, epoch
+        s[victim + 1] = (self.epoch << 32) | min(n_tokens, _LEN_MASK)
+        s[victim] = key
+
+    def close(self):
+        if self._mm.closed:
+            return
+        self._slots.release()
+        self._mm.flush()
+        HEADER.pack_into(self._mm, 0, MAGIC, self.n_buckets, WAYS, self.epoch, 0)
+        self._mm.flush()
+        self._mm.close()
+        os.close(self._fd)  # flock 도 같이 풀림
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,155 @@
+# token_filter.py
+"""
+MMPR 변환기 (convert_conv / convert_dpo / convert_small_sft_dpo) 가 같이 쓰는 토큰 길이 필터.
+
+레코드마다 tokenizer.encode(merged) 를 부르던 것을 batch_size 개씩 모아 fast tokenizer 로
+한 번에 인코딩하고, batch 들을 여러 프로세스에 나눠 보낸다.
+토큰 수는 레코드마다 encode(text, add_special_tokens=False) 하던 것과 같으므로 걸러지는 결과도 같다.
+한 번 잰 텍스트는 token_cache 에 남겨 두어 다음 실행에서는 토크나이즈하지 않는다.
+
+    pairs = ((out, measure_text(fields, args.measure)) for out, fields in candidates)
+    with open_token_cache(args) as cache:
+        for out, n_tokens in iter_token_lengths(pairs, args.tokenizer, args.batch_size, args.workers, cache):
+            if n_tokens > args.max_tokens:
+                continue
+            results.append(out)
+"""
+
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+from token_cache import DEFAULT_CACHE_BYTES, TokenLengthCache, default_token_cache_path, tokenizer_fingerprint
+
+DEFAULT_TOKENIZER = "Qwen/Qwen2.5-1.5B-Instruct"
+DEFAULT_MAX_TOKENS = 1400
+DEFAULT_MEASURE = "prompt+chosen"
+DEFAULT_BATCH_SIZE = 1024
+MEASURE_FIELDS = ("prompt", "chosen", "rejected")
+
+_tokenizers = {}
+
+
+def add_token_args(parser):
+    """세 변환기에 공통인 토큰 필터 옵션."""
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS,
+                        help="잰 텍스트의 토큰 수가 이보다 많으면 버림")
+    parser.add_argument("--measure", default=DEFAULT_MEASURE,
+                        help="토큰 수를 잴 텍스트: prompt / chosen / rejected 를 + 로 이은 것 "
+                             "(공백으로 이어 붙임, SFT 는 human = prompt, gpt = chosen)")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="한 번에 인코딩할 텍스트 수")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="토크나이저 (convert_mmpr 는 annotation 읽기도) 프로세스 수")
+    parser.add_argument("--token-cache", default=None,
+                        help="토큰 수 캐시 파일 (기본: 토크나이저별 ~/.cache/llava-ov-data/token_lengths/…)")
+    parser.add_argument("--token-cache-mb", type=int, default=DEFAULT_CACHE_BYTES >> 20,
+                        help="토큰 수 캐시 크기. 차면 오래 안 쓴 것부터 덮어씀")
+    parser.add_argument("--no-token-cache", action="store_true", help="캐시 없이 모두 토크나이즈")
+
+
+def open_token_cache(args):
+    """add_token_args 옵션대로 TokenLengthCache 를 연다 (--no-token-cache 거나 다른 실행이 쓰는 중이면 빈 context)."""
+    if args.no_token_cache:
+        return nullcontext()
+    path = args.token_cache or default_token_cache_path(
+        args.tokenizer, tokenizer_fingerprint(get_tokenizer(args.tokenizer)))
+    try:
+        return TokenLengthCache(path, args.token_cache_mb << 20)
+    except BlockingIOError:
+        print(f"[WARN] {path} is in use by another run, tokenizing without the cache")
+        return nullcontext()
+
+
+def measure_text(fields, measure=DEFAULT_MEASURE):
+    """
+    fields: {"prompt", "chosen", "rejected"} 의 값. measure="prompt+chosen" 이면
+    f"{prompt} {chosen}".strip() (기존 변환기의 merged 와 같음).
+    """
+    names = measure.split("+")
+    unknown = [n for n in names if n not in MEASURE_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown --measure field(s) {unknown} (expected {MEASURE_FIELDS} joined by '+')")
+    return " ".join(fields.get(n, "") for n in names).strip()
+
+
+def get_tokenizer(name):
+    tok = _tokenizers.get(name)
+    if tok is None:
+        from transformers import AutoTokenizer
+        tok = _tokenizers[name] = AutoTokenizer.from_pretrained(name, use_fast=True)
+    return tok
+
+
+def token_lengths(texts, tokenizer_name=DEFAULT_TOKENIZER):
+    """texts 각각의 토큰 수 (add_special_tokens=False). batch 하나를 한 번에 인코딩."""
+    enc = get_tokenizer(tokenizer_name)(list(texts), add_special_tokens=False,
+                                        return_attention_mask=False, return_token_type_ids=False)
+    return [len(ids) for ids in enc["input_ids"]]
+
+
+def _init_worker(tokenizer_name):
+    # 프로세스마다 Rust 스레드 풀까지 돌리면 코어를 서로 뺏음
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    get_tokenizer(tokenizer_name)
+
+
+def _batched(pairs, batch_size):
+    it = iter(pairs)
+    while batch := list(islice(it, batch_size)):
+        yield batch
+
+
+def _done(value):
+    fut = Future()
+    fut.set_result(value)
+    return fut
+
+
+def _finish(batch, keys, known, fut, cache):
+    """캐시에 없던 텍스트의 토큰 수를 채워 넣고 (레코드, 토큰 수) 를 yield."""
+    computed = iter(fut.result()) if fut is not None else iter(())
+    for (rec, _), key, n in zip(batch, keys, known):
+        if n is None:
+            n = next(computed)
+            if cache is not None:
+                cache.put(key, n)
+        yield rec, n
+
+
+def iter_token_lengths(pairs, tokenizer_name=DEFAULT_TOKENIZER, batch_size=DEFAULT_BATCH_SIZE, workers=1,
+                       cache=None):
+    """
+    pairs: (레코드, 잴 텍스트) iterable. (레코드, 토큰 수) 를 원래 순서대로 yield.
+    cache: TokenLengthCache (선택). 캐시에 있는 텍스트는 토크나이저로 보내지 않는다.
+    workers > 1 이면 batch 를 프로세스 풀에 보내고 workers * 2 개까지만 미리 띄운다
+    (pairs 를 필요한 만큼만 당겨 오므로 호출 쪽에서 중간에 멈춰도 됨).
+    """
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tokenizer_name,))
+    try:
+        inflight = deque()
+        for batch in _batched(pairs, batch_size):
+            texts = [t for _, t in batch]
+            if cache is not None:
+                keys = [cache.key(t) for t in texts]
+                known = [cache.get(k) for k in keys]
+            else:
+                keys = known = [None] * len(texts)
+            missing = [t for t, n in zip(texts, known) if n is None]
+            if not missing:
+                fut = None
+            elif pool is not None:
+                fut = pool.submit(token_lengths, missing, tokenizer_name)
+            else:
+                fut = _done(token_lengths(missing, tokenizer_name))
+            inflight.append((batch, keys, known, fut))
+            if len(inflight) >= max(workers * 2, 1):
+                yield from _finish(*inflight.popleft(), cache)
+        while inflight:
+            yield from _finish(*inflight.popleft(), cache)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
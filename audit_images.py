@@ -0,0 +1,284 @@
+# audit_images.py
+"""
+yaml mixture (datasets: - json_path) 나 JSON / JSONL 파일이 가리키는 모든 image 를
+학습 전에 한꺼번에 검사한다: 파일이 있는지, 크기가 --min-bytes 이상인지, (선택) 헤더가 열리는지.
+
+    python audit_images.py OneVisionData/single_image.yaml --image-root /mnt/ssd/junha/dataset
+    python audit_images.py MMPR-v1.2/sft_mmpr_llava_format.json --decode --report bad_images.csv
+
+- 이미지를 디렉토리별로 묶어 디렉토리마다 os.listdir 한 번으로 존재를 확인하고,
+  JSON 이 가리키는 이름만 stat 해서 크기를 본다 (없는 파일 / 안 쓰는 파일은 stat 하지 않음)
+- stat / 헤더 검사는 디렉토리를 STAT_CHUNK 개씩 나눠 스레드 풀로 동시에, JSON 파싱은 프로세스 풀로 동시에
+- 캐시: 매번 새로 stat 한 (크기, mtime) 이 지난번과 같은 파일은 헤더를 다시 열지 않는다
+  (제자리에서 덮어쓴 파일도 mtime 이 바뀌므로 다시 검사됨)
+- "…/images_0.tar/{name}" 처럼 tar 안을 가리키는 경로는 tar 의 .idx 인덱스로 확인 (tar_extract --image-layout tar)
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import yaml
+from PIL import Image, UnidentifiedImageError
+from tqdm import tqdm
+
+from file_cache import ResultCache, default_cache_path
+from indexed_tar import read_image_bytes, read_index
+from json_stream import iter_json_array
+
+CACHE_VERSION = 2
+DEFAULT_IMAGE_ROOT = "/mnt/ssd/junha/dataset"
+DEFAULT_THREADS = 32
+STAT_CHUNK = 256  # 스레드 하나가 한 번에 검사하는 이름 수
+REPORT_FIELDS = ["json_path", "index", "id", "image", "problem"]
+
+
+def expand_inputs(inputs):
+    """yaml 은 datasets 의 json_path 들로 풀고, JSON / JSONL 은 그대로. 중복은 한 번만."""
+    paths = []
+    for p in inputs:
+        if p.endswith((".yaml", ".yml")):
+            with open(p, "r", encoding="utf-8") as yf:
+                cfg = yaml.safe_load(yf)
+            paths.extend(ds["json_path"] for ds in cfg.get("datasets", []) or [] if ds.get("json_path"))
+        else:
+            paths.append(p)
+    return list(dict.fromkeys(paths))
+
+
+def _iter_records(json_path):
+    if json_path.endswith(".jsonl"):
+        with open(json_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from iter_json_array(json_path)
+
+
+def collect_images(json_path, image_root):
+    """
+    json_path 의 레코드가 가리키는 image 를 디렉토리별로 모은다.
+    반환: {디렉토리 또는 tar 경로: [(파일 / member 이름, 레코드 번호, id)]}
+    """
+    groups = defaultdict(list)
+    for idx, item in enumerate(_iter_records(json_path)):
+        images = item.get("image")
+        if images is None:
+            continue
+        for image in images if isinstance(images, list) else [images]:
+            full = os.path.join(image_root, image)
+            tar_path, sep, name = full.partition(".tar/")
+            if sep:
+                groups[tar_path + ".tar"].append((name, idx, item.get("id")))
+            else:
+                groups[os.path.dirname(full)].append((os.path.basename(full), idx, item.get("id")))
+    return dict(groups)
+
+
+def _iter_collected(json_paths, image_root, workers):
+    """(json_path, collect_images 결과 또는 예외) 를 끝나는 순서대로 yield."""
+    if workers <= 1:
+        for jp in json_paths:
+            try:
+                yield jp, collect_images(jp, image_root)
+            except Exception as e:
+                yield jp, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(collect_images, jp, image_root): jp for jp in json_paths}
+        for fut in as_completed(futures):
+            try:
+                yield futures[fut], fut.result()
+            except Exception as e:
+                yield futures[fut], e
+
+
+class _Listings:
+    """
+    디렉토리는 os.listdir 한 번 → 이름 set, tar 는 .idx 한 번 → ({이름: 크기}, tar mtime_ns).
+    같은 디렉토리의 조각들이 여러 스레드에서 같이 물어보므로 처음 물은 스레드만 읽고 나머지는 기다린다.
+    없는 디렉토리 / tar 는 빈 목록. 디렉토리 검사가 끝나면 drop() 으로 목록을 버린다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def get(self, d):
+        with self._lock:
+            fut = self._futures.get(d)
+            owner = fut is None
+            if owner:
+                fut = self._futures[d] = Future()
+        if owner:
+            try:
+                fut.set_result(self._read(d))
+            except Exception as e:
+                fut.set_exception(e)
+        return fut.result()
+
+    def drop(self, d):
+        with self._lock:
+            self._futures.pop(d, None)
+
+    @staticmethod
+    def _read(d):
+        if d.endswith(".tar"):
+            try:
+                st = os.stat(d)
+                index = read_index(d)
+            except FileNotFoundError:
+                return {}, None
+            return {name: size for name, (_, size) in index.items()}, st.st_mtime_ns
+        try:
+            return set(os.listdir(d))
+        except FileNotFoundError:
+            return set()
+
+
+def _stat(d, name, listing):
+    """(크기, mtime_ns). 없으면 None."""
+    if d.endswith(".tar"):
+        sizes, mtime_ns = listing
+        size = sizes.get(name)
+        return None if size is None else (size, mtime_ns)
+    if name not in listing:
+        return None
+    try:
+        st = os.stat(os.path.join(d, name))
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _decode_error(path):
+    """헤더를 열어 볼 수 없으면 그 에러 문자열, 괜찮으면 None."""
+    try:
+        with Image.open(BytesIO(read_image_bytes(path))) as img:
+            img.size  # 여기까지는 헤더만 읽음
+    except UnidentifiedImageError:
+        return "UnidentifiedImageError"  # 메시지에는 BytesIO 주소만 들어 있음
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def audit_names(d, names, min_bytes, decode, cache, listings):
+    """
+    디렉토리(또는 tar) d 안의 names 를 검사한다. cache 는 읽기만 함 (쓰기는 main 스레드).
+    반환: ({이름: 문제}, 캐시에 넣을 [(경로, fingerprint, 결과)])
+    """
+    listing = listings.get(d)
+    problems = {}
+    updates = []
+    for name in names:
+        stat = _stat(d, name, listing)
+        if stat is None:
+            problems[name] = "missing"
+            continue
+        size, mtime_ns = stat
+        if size < min_bytes:
+            problems[name] = f"too_small ({size} bytes)"
+            continue
+        if not decode:
+            continue
+        path = os.path.join(d, name)
+        entry = cache.get(path) if cache is not None else None
+        if entry is not None and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+            error = entry["result"]
+        else:
+            error = _decode_error(path)
+            updates.append((path, {"size": size, "mtime_ns": mtime_ns}, error))
+        if error is not None:
+            problems[name] = f"undecodable ({error})"
+    return problems, updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mixture / JSON 이 가리키는 image 의 존재 / 크기 / 헤더를 검사합니다.")
+    parser.add_argument("inputs", nargs="+", help="yaml mixture 또는 JSON / JSONL 파일")
+    parser.add_argument("--image-root", default=DEFAULT_IMAGE_ROOT, help="image 상대 경로의 기준 폴더")
+    parser.add_argument("--min-bytes", type=int, default=1, help="이보다 작은 파일은 깨진 것으로 봄")
+    parser.add_argument("--decode", action="store_true", help="PIL 로 헤더까지 열어 봄")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="JSON 파싱 프로세스 수")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="stat / 헤더 검사 스레드 수")
+    parser.add_argument("--report", default=None, help="문제가 있는 image 목록 CSV")
+    parser.add_argument("--cache", default=default_cache_path("audit_images"),
+                        help="헤더 검사 결과 캐시 경로")
+    parser.add_argument("--no-cache", action="store_true", help="캐시를 무시하고 모두 다시 확인")
+    args = parser.parse_args()
+
+    # 1) JSON 들에서 image 경로 모으기 (디렉토리별)
+    json_paths = expand_inputs(args.inputs)
+    groups = defaultdict(lambda: defaultdict(list))  # 디렉토리 → 이름 → [(json_path, 레코드 번호, id)]
+    failed = []
+    for jp, result in tqdm(_iter_collected(json_paths, args.image_root, args.workers),
+                           total=len(json_paths), desc="Reading JSON"):
+        if isinstance(result, Exception):
+            tqdm.write(f"[FAIL] {jp}: {result!r}")
+            failed.append(jp)
+            continue
+        for d, refs in result.items():
+            for name, idx, rec_id in refs:
+                groups[d][name].append((jp, idx, rec_id))
+    n_images = sum(len(names) for names in groups.values())
+
+    # 2) 디렉토리를 STAT_CHUNK 개씩 나눠 검사 (스레드 풀)
+    cache = ResultCache(args.cache, version=CACHE_VERSION)
+    lookup = None if args.no_cache else cache
+    listings = _Listings()
+    problems = Counter()
+    rows = []
+    with ThreadPoolExecutor(max_workers=args.threads) as pool, \
+            tqdm(total=n_images, desc="Images") as progress:
+        futures = {}
+        remaining = Counter()  # 디렉토리 → 안 끝난 조각 수
+        for d, names in groups.items():
+            names = list(names)
+            for i in range(0, len(names), STAT_CHUNK):
+                chunk = names[i:i + STAT_CHUNK]
+                fut = pool.submit(audit_names, d, chunk, args.min_bytes, args.decode, lookup, listings)
+                futures[fut] = (d, len(chunk))
+                remaining[d] += 1
+        for fut in as_completed(futures):
+            d, n = futures[fut]
+            progress.update(n)
+            remaining[d] -= 1
+            if not remaining[d]:
+                listings.drop(d)
+            dir_problems, updates = fut.result()
+            for path, fp, result in updates:
+                cache.put(path, fp, result)
+            for name, problem in sorted(dir_problems.items()):
+                problems[problem.partition(" ")[0]] += 1  # missing / too_small / undecodable
+                for jp, idx, rec_id in groups[d][name]:
+                    rows.append({"json_path": jp, "index": idx, "id": rec_id,
+                                 "image": os.path.join(d, name), "problem": problem})
+    cache.save()
+
+    # 3) 보고
+    if args.report:
+        with open(args.report, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        for row in rows[:20]:
+            print(f"[WARN] {row['image']}: {row['problem']} ({row['json_path']} #{row['index']})")
+        if len(rows) > 20:
+            print(f"[WARN] ... {len(rows) - 20} more (use --report to save all)")
+    summary = ", ".join(f"{k} {v:,}" for k, v in sorted(problems.items())) or "no problems"
+    print(f"[DONE] {n_images:,} images in {len(groups):,} directories from {len(json_paths) - len(failed)} files: "
+          f"{summary}")
+    if failed or problems:
+        raise SystemExit(f"{sum(problems.values()):,} bad images, {len(failed)} unreadable files")
+
+
+if __name__ == "__main__":
+    main()
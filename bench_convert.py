@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# bench_convert.py
+"""
+parquet → JSON + image 변환기 처리량 벤치마크.
+
+실제 HF 데이터셋 없이 합성 parquet 데이터셋을 만들어 convert_dataset 을 끝까지 돌리고
+rows/s, MB/s (입력 parquet 기준), peak RSS (케이스 프로세스 안에서 잰 것), stage 별 시간을 JSON 으로 남긴다.
+버전 사이의 성능 회귀는 --baseline 으로 이전 결과 파일과 비교한다.
+
+  - onevision: {data}/OneVisionData/{name}/train-0000x-of-0000N.parquet
+               → ov_data_imagenet2backbone.convert_dataset
+  - recap:     {data}/{name}/data/train-0000x-of-0000N.parquet
+               → parquet2json-image.convert_dataset
+
+이미지는 baseline JPEG, progressive JPEG, PNG (RGB / RGBA / P) 를 섞고,
+일부 row 는 깨진 bytes 이거나 이미지가 없다.
+
+Example:
+    python bench_convert.py --rows 20000 --workers 1 8 --image-layouts flat tar \
+        --output bench_results/$(git rev-parse --short HEAD).json
+    python bench_convert.py --output new.json --baseline old.json
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from PIL import Image
+
+from convert_utils import IMAGE_LAYOUTS
+
+DATASET_LAYOUTS = ("onevision", "recap")
+SPEC_NAME = "bench_spec.json"
+
+# 합성 이미지 종류별 비율 (corrupt: 디코딩 불가 bytes, none: image 컬럼이 null)
+IMAGE_MIX = {
+    "jpeg": 0.45,
+    "jpeg_progressive": 0.10,
+    "png_rgb": 0.15,
+    "png_rgba": 0.15,
+    "png_p": 0.05,
+    "corrupt": 0.05,
+    "none": 0.05,
+}
+VARIANTS = 16  # 종류별로 미리 만들어 돌려 쓰는 서로 다른 이미지 수
+
+
+# ── 1) 합성 parquet 데이터셋 ─────────────────────────────────────────
+def _make_image(kind, size, rng):
+    """kind 에 맞는 이미지 bytes 한 개. 노이즈 + 그라디언트라 JPEG 로 적당히 안 줄어듦."""
+    w, h = size
+    noise = Image.effect_noise((w, h), rng.randint(20, 80))
+    grad = Image.linear_gradient("L").resize((w, h))
+    rgb = Image.merge("RGB", (noise, grad, noise.transpose(Image.FLIP_LEFT_RIGHT)))
+    buf = BytesIO()
+    if kind == "jpeg":
+        rgb.save(buf, "JPEG", quality=90)
+    elif kind == "jpeg_progressive":
+        rgb.save(buf, "JPEG", quality=90, progressive=True)
+    elif kind == "png_rgb":
+        rgb.save(buf, "PNG")
+    elif kind == "png_rgba":
+        rgba = rgb.copy()
+        rgba.putalpha(grad)
+        rgba.save(buf, "PNG")
+    elif kind == "png_p":
+        rgb.quantize(64).save(buf, "PNG")
+    elif kind == "corrupt":
+        # JPEG 앞부분만 남긴 잘린 파일 또는 아무 bytes
+        rgb.save(buf, "JPEG")
+        return buf.getvalue()[: rng.randint(16, 256)] if rng.random() < 0.5 else os.urandom(64)
+    else:
+        raise ValueError(kind)
+    return buf.getvalue()
+
+
+def _image_pool(size, seed):
+    rng = random.Random(seed)
+    return {
+        kind: [_make_image(kind, size, rng) for _ in range(VARIANTS)]
+        for kind in IMAGE_MIX
+        if kind != "none"
+    }
+
+
+def generate_dataset(out_dir, name, rows, files, row_group_size, image_size, seed):
+    """out_dir 에 parquet 파일 files 개 (id, conversations, image{bytes, path}) 를 만든다."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    pool = _image_pool(image_size, seed)
+    kinds, weights = zip(*IMAGE_MIX.items())
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("conversations", pa.list_(pa.struct([("from", pa.string()), ("value", pa.string())]))),
+        ("image", pa.struct([("bytes", pa.binary()), ("path", pa.string())])),
+    ])
+
+    per_file = -(-rows // files)
+    for f in range(files):
+        start, stop = f * per_file, min(rows, (f + 1) * per_file)
+        ids, convs, images = [], [], []
+        for i in range(start, stop):
+            kind = rng.choices(kinds, weights)[0]
+            ids.append(f"{name}_{i:08d}")
+            convs.append([
+                {"from": "human", "value": "<image>\n" + "Describe the image. " * rng.randint(1, 8)},
+                {"from": "gpt", "value": "A synthetic picture. " * rng.randint(4, 40)},
+            ])
+            images.append(None if kind == "none" else {"bytes": rng.choice(pool[kind]), "path": None})
+        table = pa.table({"id": ids, "conversations": convs, "image": images}, schema=schema)
+        path = os.path.join(out_dir, f"train-{f:05d}-of-{files:05d}.parquet")
+        pq.write_table(table, path, row_group_size=row_group_size)
+
+
+def prepare_data(data_dir, layout, spec):
+    """spec 이 같은 데이터가 이미 있으면 재사용. 변환기에 넘길 source 폴더 경로를 반환."""
+    name = f"bench-{layout}"
+    if layout == "onevision":
+        source_root = os.path.join(data_dir, "OneVisionData", name)
+        parquet_dir = source_root
+    else:
+        source_root = os.path.join(data_dir, name)
+        parquet_dir = os.path.join(source_root, "data")
+
+    spec_path = os.path.join(source_root, SPEC_NAME)
+    if os.path.exists(spec_path):
+        with open(spec_path, encoding="utf-8") as f:
+            if json.load(f) == spec:
+                print(f"[DATA] reusing {source_root}")
+                return source_root
+        shutil.rmtree(source_root)
+
+    print(f"[DATA] generating {spec['rows']:,} rows → {source_root}")
+    t0 = time.perf_counter()
+    generate_dataset(parquet_dir, name, spec["rows"], spec["files"], spec["row_group_size"],
+                     tuple(spec["image_size"]), spec["seed"])
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2)
+    print(f"[DATA] done in {time.perf_counter() - t0:.1f}s")
+    return source_root
+
+
+# ── 2) 케이스 실행 (케이스마다 새 프로세스) ──
+# 자식 프로세스는 부모의 ru_maxrss 를 물려받으므로 (데이터를 만든 driver 의 peak 이상이 찍힘)
+# 케이스를 시작할 때 /proc/self/clear_refs 로 peak 을 지금 RSS 로 되돌리고 끝나면 VmHWM 을 읽는다.
+# 되돌릴 수 없는 환경이면 ru_maxrss 에서 시작할 때의 RSS 를 뺀 값 (peak_rss_kind = "delta").
+def _proc_status_kb(field):
+    """/proc/self/status 의 field (VmHWM / VmRSS) 값 (KiB). 없으면 None."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """이 프로세스의 peak RSS (VmHWM) 를 지금 RSS 로 되돌린다 (Linux 4.0+). 성공하면 True."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        return False
+    hwm, rss = _proc_status_kb("VmHWM"), _proc_status_kb("VmRSS")
+    return hwm is not None and rss is not None and hwm <= rss
+
+
+def _dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def _run_case(case, source_root, target_base, conn):
+    try:
+        sys.stdout = open(os.devnull, "w")  # 변환기의 진행 메시지는 숨김
+        sys.stderr = sys.stdout
+        reset = _reset_peak_rss()
+        start_rss = 0 if reset else (_proc_status_kb("VmRSS") or 0)
+        kwargs = {
+            "workers": case["workers"],
+            "passthrough": case["passthrough"],
+            "image_layout": case["image_layout"],
+            "writer_threads": case["writer_threads"],
+            "restart": True,
+        }
+        t0 = time.perf_counter()
+        if case["dataset_layout"] == "onevision":
+            result = importlib.import_module("ov_data_imagenet2backbone").convert_dataset(
+                source_root, target_base, **kwargs)
+        else:
+            result = importlib.import_module("parquet2json-image").convert_dataset(
+                source_root, "bench.json", target_base=target_base, **kwargs)
+        wall = time.perf_counter() - t0
+        # Linux 의 ru_maxrss 는 KiB. RUSAGE_CHILDREN 은 끝난 worker 중 가장 큰 값
+        # (worker 는 peak 을 되돌린 뒤의 이 프로세스에서 fork 되므로 driver 의 peak 은 안 섞임)
+        if reset:
+            self_rss = _proc_status_kb("VmHWM")
+        else:
+            self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+        child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        conn.send({
+            "wall": wall,
+            "count": result["count"],
+            "bad_samples": len(result["bad_samples"]),
+            "image_counts": dict(result["image_counts"]),
+            "stages": result["stages"],
+            "queue_depth": result["queue_depth"],
+            "peak_rss_mb": self_rss / 1024,
+            "peak_rss_kind": "hwm" if reset else "delta",
+            "peak_worker_rss_mb": child_rss / 1024,
+        })
+    except BaseException as e:
+        conn.send({"error": repr(e)})
+    finally:
+        conn.close()
+
+
+def run_case(case, source_root, work_dir):
+    target_base = os.path.join(work_dir, "out")
+    shutil.rmtree(target_base, ignore_errors=True)
+    os.makedirs(target_base)
+
+    recv, send = mp.Pipe(duplex=False)
+    proc = mp.get_context("spawn").Process(target=_run_case, args=(case, source_root, target_base, send))
+    proc.start()
+    send.close()
+    stats = recv.recv() if recv.poll(None) else {"error": "no result"}
+    proc.join()
+    if "error" in stats:
+        raise RuntimeError(f"case {case} failed: {stats['error']}")
+
+    rows = in_bytes = 0
+    for root, _, files in os.walk(source_root):
+        for name in files:
+            if name.endswith(".parquet"):
+                path = os.path.join(root, name)
+                in_bytes += os.path.getsize(path)
+                rows += pq.ParquetFile(path).metadata.num_rows
+    out_bytes = _dir_bytes(target_base)
+    shutil.rmtree(target_base, ignore_errors=True)
+
+    wall = stats["wall"]
+    return {
+        **case,
+        "rows": rows,
+        "input_bytes": in_bytes,
+        "output_bytes": out_bytes,
+        "rows_per_s": rows / wall,
+        "input_mb_per_s": in_bytes / 2**20 / wall,
+        "output_mb_per_s": out_bytes / 2**20 / wall,
+        **stats,
+    }
+
+
+def case_key(case):
+    return (f"{case['dataset_layout']}/{case['image_layout']}/w{case['workers']}"
+            f"/wt{case['writer_threads']}{'/pt' if case['passthrough'] else ''}")
+
+
+# ── 3) 결과 비교 ─────────────────────────────────────────────────────
+def compare(results, baseline_path, tolerance):
+    """baseline 대비 rows/s 가 tolerance 이상 떨어진 케이스 수를 반환."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {case_key(c): c for c in json.load(f)["cases"]}
+    regressions = 0
+    print(f"\n[COMPARE] vs {baseline_path}")
+    for case in results:
+        key = case_key(case)
+        old = baseline.get(key)
+        if old is None:
+            print(f"  {key:<40} (new case)")
+            continue
+        ratio = case["rows_per_s"] / old["rows_per_s"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  ← REGRESSION"
+            regressions += 1
+        print(f"  {key:<40} {old['rows_per_s']:>9.0f} → {case['rows_per_s']:>9.0f} rows/s "
+              f"({ratio:.2f}x), RSS {old['peak_rss_mb']:.0f} → {case['peak_rss_mb']:.0f} MB{flag}")
+    return regressions
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="합성 parquet 데이터셋으로 변환기 처리량(rows/s, MB/s, peak RSS, stage 시간)을 잽니다."
+    )
+    parser.add_argument("--output", default="bench_results.json", help="결과 JSON 파일 경로")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON (rows/s 회귀를 표시)")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="--baseline 대비 이만큼(비율) 느려지면 회귀로 보고 exit 1")
+    parser.add_argument("--work-dir", help="합성 데이터/변환 결과를 둘 폴더 (기본: 임시 폴더, 끝나면 삭제)")
+    parser.add_argument("--dataset-layouts", nargs="+", choices=DATASET_LAYOUTS, default=list(DATASET_LAYOUTS))
+    parser.add_argument("--rows", type=int, default=5000, help="데이터셋당 row 수")
+    parser.add_argument("--files", type=int, default=4, help="데이터셋당 parquet 파일 수")
+    parser.add_argument("--row-group-size", type=int, default=256)
+    parser.add_argument("--image-size", type=int, nargs=2, default=(384, 288), metavar=("W", "H"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--image-layouts", nargs="+", choices=IMAGE_LAYOUTS, default=["flat"])
+    parser.add_argument("--writer-threads", type=int, nargs="+", default=[0])
+    parser.add_argument("--passthrough", action="store_true", help="--passthrough 켠 케이스도 추가")
+    parser.add_argument("--repeat", type=int, default=1, help="케이스별 반복 횟수 (가장 빠른 결과를 기록)")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="convert_bench_")
+    spec = {
+        "rows": args.rows,
+        "files": args.files,
+        "row_group_size": args.row_group_size,
+        "image_size": list(args.image_size),
+        "seed": args.seed,
+        "image_mix": IMAGE_MIX,
+    }
+
+    results = []
+    try:
+        for dataset_layout in args.dataset_layouts:
+            source_root = prepare_data(os.path.join(work_dir, "data"), dataset_layout, spec)
+            for image_layout in args.image_layouts:
+                for workers in args.workers:
+                    for writer_threads in args.writer_threads:
+                        if writer_threads and image_layout == "tar":
+                            continue  # tar 는 write-behind 를 쓰지 않음
+                        for passthrough in ([False, True] if args.passthrough else [False]):
+                            case = {
+                                "dataset_layout": dataset_layout,
+                                "image_layout": image_layout,
+                                "workers": workers,
+                                "writer_threads": writer_threads,
+                                "passthrough": passthrough,
+                            }
+                            runs = [run_case(case, source_root, work_dir) for _ in range(args.repeat)]
+                            best = max(runs, key=lambda r: r["rows_per_s"])
+                            st = best["stages"]
+                            print(f"[BENCH] {case_key(case):<40} {best['rows_per_s']:>9.0f} rows/s "
+                                  f"{best['input_mb_per_s']:>7.1f} MB/s  RSS {best['peak_rss_mb']:.0f} MB "
+                                  f"(workers {best['peak_worker_rss_mb']:.0f} MB)  "
+                                  f"read {st['read']:.1f}s encode {st['encode']:.1f}s "
+                                  f"write {st['write']:.1f}s wall {st['wall']:.1f}s")
+                            results.append(best)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "git_rev": _git_rev(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "spec": spec,
+        },
+        "cases": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[DONE] {len(results)} cases → {args.output}")
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# convert_checkpoint.py
+"""
+parquet 변환을 row 단위로 이어서 할 수 있게 해 주는 체크포인트 manifest.
+
+{target_root}/.convert_manifest.json 에 다음을 기록한다.
+  - files:        입력 parquet 파일 목록 (path, size, mtime)
+  - options:      출력 경로/형식 등 결과에 영향을 주는 옵션
+  - committed:    파일별로 커밋된 row group 수와 row 범위 [0, rows)
+  - output_bytes: 출력 JSON 파일에서 커밋된 길이, count: 그때까지의 레코드 수
+  - layout_state: tar 이미지 레이아웃일 때 shard 번호와 커밋된 tar/인덱스 길이
+  - bad_count, bad_bytes: 깨진 샘플 수와 {target_root}/.convert_bad_samples.jsonl 에서 커밋된 길이
+    (샘플 목록은 manifest 에 넣지 않고 생길 때마다 이 파일에 한 줄씩 덧붙임)
+  - image_counts, complete
+
+row group 하나를 처리하고 출력 파일을 fsync 한 뒤에만 manifest 를 (원자적으로) 갱신한다.
+중단 후 재실행하면 출력 파일을 output_bytes 로, 깨진 샘플 파일을 bad_bytes 로 잘라내고
+다음 row group 부터 이어간다.
+입력 파일이나 옵션이 바뀌었으면 처음부터 다시 한다.
+"""
+
+import json
+import os
+
+MANIFEST_NAME = ".convert_manifest.json"
+BAD_SAMPLES_NAME = ".convert_bad_samples.jsonl"
+
+
+def _file_stat(path):
+    st = os.stat(path)
+    return {"path": path, "size": st.st_size, "mtime": st.st_mtime}
+
+
+def manifest_path(target_root):
+    return os.path.join(target_root, MANIFEST_NAME)
+
+
+def bad_samples_path(target_root):
+    return os.path.join(target_root, BAD_SAMPLES_NAME)
+
+
+def load_manifest(target_root):
+    """manifest 가 없거나 깨졌으면 None."""
+    try:
+        with open(manifest_path(target_root), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def committed_rows(manifest):
+    """manifest 에 커밋된 전체 row 수."""
+    return sum(c["rows"][1] for c in manifest["committed"].values())
+
+
+class ConvertCheckpoint:
+    """
+    target_root:   변환 결과 폴더 (manifest 가 여기에 저장됨)
+    parquet_files: 입력 parquet 파일 목록 (순서대로 처리된다고 가정)
+    options:       JSON 직렬화 가능한 dict. 반드시 "json_path" 를 포함
+    restart:       True 면 기존 manifest 를 무시하고 처음부터
+    """
+
+    def __init__(self, target_root, parquet_files, options, restart=False):
+        self.path = manifest_path(target_root)
+        self.bad_path = bad_samples_path(target_root)
+        self._bad = None
+        self.state = {
+            "files": [_file_stat(p) for p in parquet_files],
+            "options": options,
+            "committed": {},
+            "output_bytes": 0,
+            "count": 0,
+            "image_counts": {},
+            "bad_count": 0,
+            "bad_bytes": 0,
+            "layout_state": None,
+            "complete": False,
+        }
+
+        saved = None if restart else load_manifest(target_root)
+        if saved is not None and self._can_resume(saved, options):
+            self.state = saved
+
+    def _can_resume(self, saved, options):
+        if saved.get("files") != self.state["files"] or saved.get("options") != options:
+            print(f"[RESET] inputs or options changed since last run, starting over: {self.path}")
+            return False
+        if "bad_bytes" not in saved:
+            print(f"[RESET] checkpoint is from an older version, starting over: {self.path}")
+            return False
+        json_path = options["json_path"]
+        if not saved.get("complete") and (
+            not os.path.exists(json_path) or os.path.getsize(json_path) < saved["output_bytes"]
+        ):
+            print(f"[RESET] output is shorter than the checkpoint, starting over: {json_path}")
+            return False
+        bad_size = os.path.getsize(self.bad_path) if os.path.exists(self.bad_path) else 0
+        if bad_size < saved["bad_bytes"]:
+            print(f"[RESET] bad sample log is shorter than the checkpoint, starting over: {self.bad_path}")
+            return False
+        return True
+
+    @property
+    def complete(self):
+        return self.state["complete"]
+
+    @property
+    def resuming(self):
+        return bool(self.state["committed"])
+
+    @property
+    def rows_done(self):
+        return committed_rows(self.state)
+
+    def skip_row_groups(self):
+        """iter_parquet_row_groups(skip=...) 에 넘길 {path: 커밋된 row group 수}."""
+        return {path: c["row_groups"] for path, c in self.state["committed"].items()}
+
+    def _bad_file(self):
+        """깨진 샘플 파일을 커밋된 길이로 잘라서 이어 쓰기로 연다 (처음이면 비움)."""
+        if self._bad is None:
+            self._bad = open(self.bad_path, "ab")
+            self._bad.truncate(self.state["bad_bytes"])
+            self._bad.seek(0, os.SEEK_END)
+            self._bad_count = self.state["bad_count"]
+            self._bad_synced = True
+        return self._bad
+
+    def add_bad_sample(self, sample):
+        """깨진 샘플 하나 ({"id", "reason"}) 를 파일에 덧붙인다 (bad_state() 로 커밋 지점을 잡을 때까지는 미확정)."""
+        f = self._bad_file()
+        f.write(json.dumps(sample, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._bad_count += 1
+        self._bad_synced = False
+
+    def bad_state(self):
+        """지금까지 덧붙인 깨진 샘플을 디스크에 내리고 commit() 에 넘길 {"bad_count", "bad_bytes"}."""
+        f = self._bad_file()
+        if not self._bad_synced:
+            f.flush()
+            os.fsync(f.fileno())
+            self._bad_synced = True
+        return {"bad_count": self._bad_count, "bad_bytes": f.tell()}
+
+    def bad_samples(self):
+        """커밋된 깨진 샘플 목록 (CSV 로 남길 때 한 번 읽음)."""
+        samples = []
+        if not os.path.exists(self.bad_path):
+            return samples
+        with open(self.bad_path, "rb") as f:
+            data = f.read(self.state["bad_bytes"])
+        for line in data.splitlines():
+            samples.append(json.loads(line))
+        return samples
+
+    def commit(self, path, rg, num_rows, output_bytes, count, image_counts, bad_state,
+               layout_state=None):
+        """path 의 row group rg (num_rows 행) 까지 출력이 디스크에 반영되었음을 기록."""
+        done = self.state["committed"].setdefault(path, {"row_groups": 0, "rows": [0, 0]})
+        assert rg == done["row_groups"], f"row groups must be committed in order: {path} #{rg}"
+        done["row_groups"] = rg + 1
+        done["rows"][1] += num_rows
+        self.state.update(
+            output_bytes=output_bytes,
+            count=count,
+            image_counts=dict(image_counts),
+            layout_state=layout_state,
+            **bad_state,
+        )
+        self._save()
+
+    def finish(self):
+        self.state.update(self.bad_state())
+        self.state["complete"] = True
+        self._save()
+        self._bad.close()
+        self._bad = None
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
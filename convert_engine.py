@@ -0,0 +1,288 @@
+# convert_engine.py
+"""
+parquet → JSON + image 변환 파이프라인 (ov_data_imagenet2backbone.py, parquet2json-image.py 공용).
+
+    [read]    parquet row group 읽기 + 레코드 / 이미지 job 생성           (스레드)
+        │ read_q   (bounded)
+    [encode]  이미지 디코딩·인코딩·저장 — workers > 1 이면 프로세스 풀     (스레드)
+        │ write_q  (bounded, 입력 순서 유지)
+    [write]   JSON 레코드 쓰기, tar shard 추가, 체크포인트 커밋            (호출한 스레드)
+        │ (writer_threads > 0 이면 flat / hashed 이미지는 write-behind 스레드 풀이 저장)
+
+세 stage 가 bounded queue 로 이어져 있어서 parquet I/O, PIL 디코딩, 파일 쓰기가 겹쳐서 돈다.
+진행률 표시줄에 두 queue 의 현재 깊이를 보여 주고, 끝나면 stage 별 시간과 평균 깊이를 돌려준다.
+  - read_q 가 늘 차 있으면 encode 가, write_q 가 늘 차 있으면 write 가 병목
+  - 둘 다 비어 있으면 read (parquet I/O) 가 병목
+
+write-behind 일 때 row group 의 체크포인트 커밋은 그 row group 의 이미지 쓰기가
+모두 끝난 뒤로 미룬다 (재시작 후 JSON 에는 있는데 이미지가 없는 일이 없도록).
+"""
+
+import csv
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+
+from tqdm import tqdm
+
+from convert_utils import (
+    DEFAULT_WRITE_BUFFER,
+    PASSTHROUGH,
+    REENCODED,
+    ImageSink,
+    count_parquet_rows,
+    iter_parquet_row_groups,
+    save_images,
+)
+from indexed_tar import DEFAULT_SHARD_SIZE
+from json_stream import JSONStreamWriter
+
+READ_QUEUE_SIZE = 4  # row group 단위
+
+_DONE = object()
+
+
+class _Failed:
+    """stage 스레드에서 난 예외를 write stage 로 넘기기 위한 상자."""
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _timed(fn, payload):
+    """worker 쪽에서 잰 처리 시간을 결과와 같이 돌려준다 (encode stage 시간 집계용)."""
+    t0 = time.perf_counter()
+    result = fn(payload)
+    return time.perf_counter() - t0, result
+
+
+def _make_chunk(path, rg, batch, sink):
+    """row group 하나 → ((path, rg, recs, names), jobs). 이미지가 없는 row 는 name/job 이 None."""
+    ids = batch["id"]
+    convs = batch.get("conversations") or [[] for _ in ids]
+    images = batch.get("image") or [None] * len(ids)
+
+    recs, names, jobs = [], [], []
+    for _id, conv, image in zip(ids, convs, images):
+        rec = {"id": _id, "conversations": conv}
+        bytes_ = image.get("bytes") if image else None
+        name = job = None
+        if bytes_:
+            name = f"{_id}.jpg"
+            job = (bytes_, sink.save_path(name))
+        recs.append(rec)
+        names.append(name)
+        jobs.append(job)
+    return (path, rg, recs, names), jobs
+
+
+def _commit_ready(pending, ckpt, wait=False):
+    """
+    pending: (쓰기 Future 목록, commit 인자) 의 deque. 앞에서부터 이미지 쓰기가 끝난 것만
+    순서대로 커밋한다. wait=True 면 남은 쓰기를 모두 기다린다.
+    """
+    while pending and (wait or all(f.done() for f in pending[0][0])):
+        writes, args = pending.popleft()
+        for f in writes:
+            f.result()  # 쓰기 실패 (디스크 가득 참 등) 는 여기서 올라가 변환을 멈춤
+        ckpt.commit(*args)
+
+
+def convert_parquet(
+    parquet_files,
+    ckpt,
+    json_path,
+    image_dir,
+    image_prefix,
+    output_format="json",
+    indent=2,
+    image_layout="flat",
+    shard_size=DEFAULT_SHARD_SIZE,
+    workers=1,
+    passthrough=False,
+    writer_threads=0,
+    write_buffer=DEFAULT_WRITE_BUFFER,
+    durable=False,
+    executor=None,
+    progress=None,
+    desc=None,
+):
+    """
+    parquet_files 를 변환해 json_path 에 레코드를, image_dir 에 이미지를 쓴다.
+
+    ckpt:         ConvertCheckpoint. 커밋된 row group 은 건너뛰고, row group 마다 커밋한다
+    image_prefix: JSON image 경로 앞부분 (e.g. "OneVisionData/ai2d/image")
+    writer_threads, write_buffer:
+                  > 0 이면 flat / hashed 이미지를 write-behind 스레드 풀이 저장 (ImageSink 참고)
+    durable:      끝날 때 이미지까지 디스크로 내린 뒤 체크포인트를 complete 로 표시
+    executor:     여러 데이터셋이 공유하는 ProcessPoolExecutor (없으면 workers > 1 일 때 새로 만듦)
+    progress:     공유 tqdm (없으면 desc 로 새로 만듦)
+
+    반환: {"count", "bad_samples", "image_counts", "stages", "queue_depth"}
+    """
+    image_counts = Counter(ckpt.state["image_counts"])  # passthrough / reencoded 개수
+    busy = Counter()  # stage 별 누적 시간 (encode 는 worker CPU 시간 합)
+    depth = Counter()  # chunk 마다 잰 queue 깊이 합
+    chunks = 0
+
+    resume_offset = ckpt.state["output_bytes"] if ckpt.resuming else None
+    layout_resume = ckpt.state["layout_state"] if ckpt.resuming else None
+    read_q = queue.Queue(maxsize=READ_QUEUE_SIZE)
+    write_q = queue.Queue(maxsize=max(workers, 1) * 2)  # 동시에 떠 있는 encode chunk 수 제한
+    stop = threading.Event()
+    encode_fn = partial(_timed, partial(save_images, passthrough=passthrough))
+    own_pool = executor is None and workers > 1
+    pending = deque()  # 이미지 쓰기가 끝나길 기다리는 커밋
+    started = time.perf_counter()
+
+    with ImageSink(image_dir, image_layout, shard_size, resume=layout_resume,
+                   writer_threads=writer_threads, write_buffer=write_buffer) as sink, \
+            JSONStreamWriter(json_path, output_format, indent=indent,
+                             resume_offset=resume_offset, resume_count=ckpt.state["count"]) as out, \
+            (ProcessPoolExecutor(max_workers=workers) if own_pool else nullcontext(executor)) as pool, \
+            (nullcontext(progress) if progress is not None else
+             tqdm(total=count_parquet_rows(parquet_files), initial=ckpt.rows_done, desc=desc)) as pbar:
+
+        def read_stage():
+            try:
+                row_groups = iter_parquet_row_groups(parquet_files, skip=ckpt.skip_row_groups())
+                while True:
+                    t0 = time.perf_counter()
+                    item = next(row_groups, None)
+                    if item is None:
+                        break
+                    chunk = _make_chunk(*item, sink)
+                    busy["read"] += time.perf_counter() - t0
+                    if not _put(read_q, chunk, stop):
+                        return
+            except BaseException as e:
+                _put(read_q, _Failed(e), stop)
+                return
+            _put(read_q, _DONE, stop)
+
+        def encode_stage():
+            try:
+                while True:
+                    chunk = _get(read_q, stop)
+                    if chunk is None:
+                        return
+                    if chunk is _DONE or isinstance(chunk, _Failed):
+                        _put(write_q, chunk, stop)
+                        return
+                    meta, jobs = chunk
+                    result = pool.submit(encode_fn, jobs) if pool is not None else encode_fn(jobs)
+                    if not _put(write_q, (meta, result), stop):
+                        return
+            except BaseException as e:
+                _put(write_q, _Failed(e), stop)
+
+        threads = [
+            threading.Thread(target=read_stage, name="convert-read", daemon=True),
+            threading.Thread(target=encode_stage, name="convert-encode", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                item = write_q.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failed):
+                    raise item.exc
+                (path, rg, recs, names), result = item
+                elapsed, results = result.result() if isinstance(result, Future) else result
+                busy["encode"] += elapsed
+
+                t0 = time.perf_counter()
+                for rec, name, (kind, err, data) in zip(recs, names, results):
+                    if err is not None:
+                        ckpt.add_bad_sample({"id": rec["id"], "reason": err})
+                        continue  # 깨진 샘플은 건너뜀
+                    if name is not None:
+                        rec["image"] = os.path.join(image_prefix, sink.add(name, data))
+                        image_counts[kind] += 1
+                    out.write(rec)
+                # 출력이 디스크에 반영된 뒤에 (write-behind 면 이미지 쓰기까지 끝난 뒤에) 커밋
+                pending.append((sink.mark(), (path, rg, len(recs), out.sync(), out.count,
+                                              dict(image_counts), ckpt.bad_state(), sink.sync())))
+                _commit_ready(pending, ckpt)
+                busy["write"] += time.perf_counter() - t0
+
+                chunks += 1
+                depth["read_q"] += read_q.qsize()
+                depth["write_q"] += write_q.qsize()
+                pbar.update(len(recs))
+                pbar.set_postfix(read_q=read_q.qsize(), write_q=write_q.qsize(), refresh=False)
+
+            t0 = time.perf_counter()
+            _commit_ready(pending, ckpt, wait=True)
+            sink.flush(durable)
+            busy["write"] += time.perf_counter() - t0
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+    ckpt.finish()
+
+    return {
+        "count": out.count,
+        "bad_samples": ckpt.bad_samples(),
+        "image_counts": image_counts,
+        "stages": {
+            "read": busy["read"],
+            "encode": busy["encode"],
+            "write": busy["write"],
+            "wall": time.perf_counter() - started,
+        },
+        "queue_depth": {
+            "read_q": depth["read_q"] / max(chunks, 1),
+            "write_q": depth["write_q"] / max(chunks, 1),
+            "read_q_max": read_q.maxsize,
+            "write_q_max": write_q.maxsize,
+        },
+    }
+
+
+def format_stage_report(result):
+    """convert_parquet 결과의 stage 시간 / 평균 queue 깊이를 한 줄로."""
+    st, qd = result["stages"], result["queue_depth"]
+    counts = result["image_counts"]
+    return (
+        f"stages read {st['read']:.1f}s | encode {st['encode']:.1f}s (cpu) | "
+        f"write {st['write']:.1f}s | wall {st['wall']:.1f}s; "
+        f"avg depth read_q {qd['read_q']:.1f}/{qd['read_q_max']}, "
+        f"write_q {qd['write_q']:.1f}/{qd['write_q_max']}; "
+        f"images {counts[PASSTHROUGH]:,} passed through, {counts[REENCODED]:,} re-encoded"
+    )
+
+
+def write_bad_samples(log_path, bad_samples):
+    with open(log_path, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=["id", "reason"])
+        writer.writeheader()
+        writer.writerows(bad_samples)
@@ -0,0 +1,208 @@
+# convert_utils.py
+"""
+parquet 변환기(ov_data_imagenet2backbone.py, parquet2json-image.py)가 공유하는 헬퍼.
+
+parquet 은 HF datasets 캐시를 거치지 않고 pyarrow 로 row group 단위로 직접 읽는다.
+이미지 디코딩/저장(save_images)은 row group 크기의 chunk 단위로 돌며,
+파이프라인과 프로세스 풀 구성은 convert_engine 이 맡는다.
+이미지 출력 레이아웃은 flat (image/{id}.jpg), hashed (image/ab/cd/{id}.jpg),
+tar (image/shard-00000.tar/{id}.jpg, indexed_tar 참고) 중에서 고른다.
+flat / hashed 는 write-behind(write_behind.WriteBehind) 로 메인 프로세스의 스레드 풀이 대신 쓰게 할 수 있다.
+"""
+
+import hashlib
+import os
+from io import BytesIO
+
+import pyarrow.parquet as pq
+from PIL import Image, UnidentifiedImageError
+
+from indexed_tar import DEFAULT_SHARD_SIZE, ShardedTarWriter
+from write_behind import DEFAULT_WRITE_BUFFER, WriteBehind
+
+# 변환에 필요한 컬럼만 읽는다 (image 는 bytes 필드만)
+READ_COLUMNS = ("id", "conversations", "image.bytes")
+
+
+def count_parquet_rows(parquet_files):
+    """parquet footer 메타데이터만으로 전체 row 수를 센다."""
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in parquet_files)
+
+
+def parquet_size(parquet_files):
+    """footer 메타데이터로 (전체 row 수, row group 바이트 합계)를 구한다 (스케줄링용)."""
+    rows = nbytes = 0
+    for path in parquet_files:
+        meta = pq.ParquetFile(path).metadata
+        rows += meta.num_rows
+        nbytes += sum(meta.row_group(i).total_byte_size for i in range(meta.num_row_groups))
+    return rows, nbytes
+
+
+def iter_parquet_row_groups(parquet_files, columns=READ_COLUMNS, skip=None):
+    """
+    parquet 파일들을 row group 하나씩 읽어 (path, rg_index, batch) 를 yield.
+    batch 는 {컬럼: 값 리스트} dict 이고, 파일에 없는 컬럼은 건너뛰므로 키가 없을 수 있다.
+    skip: {path: 앞에서부터 건너뛸 row group 수} (체크포인트에서 이어갈 때)
+    메모리에는 한 번에 row group 하나만 올라간다.
+    """
+    skip = skip or {}
+    for path in parquet_files:
+        pf = pq.ParquetFile(path)
+        names = set(pf.schema_arrow.names)
+        cols = [c for c in columns if c.split(".")[0] in names]
+        for rg in range(skip.get(path, 0), pf.num_row_groups):
+            yield path, rg, pf.read_row_group(rg, columns=cols).to_pydict()
+
+
+# save_image 결과 종류 (데이터셋별 통계용)
+PASSTHROUGH = "passthrough"
+REENCODED = "reencoded"
+
+
+def is_passthrough_jpeg(img, bytes_):
+    """
+    헤더만 열린 img 가 그대로 복사해도 되는 baseline RGB JPEG 인지 확인.
+    디코딩은 하지 않으므로 잘린 파일만 EOI 마커로 걸러낸다.
+    """
+    return (
+        img.format == "JPEG"
+        and img.mode == "RGB"
+        and not img.info.get("progressive")
+        and bytes_.rstrip(b"\0").endswith(b"\xff\xd9")
+    )
+
+
+def encode_image(bytes_, passthrough=False):
+    """
+    bytes_ 를 JPEG bytes 로 만들어 (kind, data) 를 반환한다.
+      - passthrough=True 이고 이미 baseline RGB JPEG 이면 원본 bytes 그대로 → PASSTHROUGH
+      - 그 외(PNG, RGBA, P, CMYK 등)는 디코딩 후 RGB 로 재인코딩 → REENCODED
+    깨진 이미지면 UnidentifiedImageError / OSError 가 그대로 올라간다.
+    """
+    img = Image.open(BytesIO(bytes_))  # 여기까지는 헤더만 읽음
+    if passthrough and is_passthrough_jpeg(img, bytes_):
+        return PASSTHROUGH, bytes_
+
+    img.load()  # 실제 디코딩 ➜ 오류가 여기서 발생하면 except 로
+
+    # JPEG에 쓸 수 없는 모드(RGBA 등)는 RGB 변환
+    if getattr(img, "mode", "RGB") != "RGB":
+        img = img.convert("RGB")
+
+    buf = BytesIO()
+    img.save(buf, "JPEG")
+    return REENCODED, buf.getvalue()
+
+
+def _write_file(path, data):
+    """디렉토리가 없을 때만 만든다 (파일마다 makedirs 를 부르면 NFS 에서 왕복이 하나 더 생김)."""
+    try:
+        f = open(path, "wb")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, "wb")
+    with f:
+        f.write(data)
+
+
+def save_image(bytes_, save_path=None, passthrough=False):
+    """
+    bytes_ 를 JPEG 로 만들어 save_path 에 저장하고 (kind, err, data) 를 반환한다.
+    save_path 가 None 이면 파일로 쓰지 않고 JPEG bytes 를 data 로 돌려준다 (tar shard 용).
+    깨진 이미지면 (None, 오류 메시지, None).
+    """
+    try:
+        kind, data = encode_image(bytes_, passthrough)
+        if save_path is None:
+            return kind, None, data
+        _write_file(save_path, data)
+    except (UnidentifiedImageError, OSError) as e:
+        return None, str(e), None
+    return kind, None, None
+
+
+def save_images(jobs, passthrough=False):
+    """jobs: [(bytes_, save_path) 또는 None, ...] → 같은 길이의 (kind, err, data) 리스트."""
+    return [save_image(*job, passthrough=passthrough) if job else (None, None, None) for job in jobs]
+
+
+IMAGE_LAYOUTS = ("flat", "hashed", "tar")
+
+
+def image_relpath(name, layout="flat"):
+    """flat / hashed 레이아웃에서 image/ 아래 상대 경로. hashed 는 md5 앞 4자리로 2단계 분산."""
+    if layout == "hashed":
+        h = hashlib.md5(name.encode("utf-8")).hexdigest()
+        return f"{h[:2]}/{h[2:4]}/{name}"
+    return name
+
+
+class ImageSink:
+    """
+    변환된 이미지를 레이아웃에 맞게 image_dir 아래에 둔다.
+
+      - flat / hashed: worker 가 save_path(name) 에 직접 저장하고, add() 는 경로만 돌려줌
+      - tar:           save_path() 가 None 이라 worker 가 JPEG bytes 를 돌려주고,
+                       add() 가 메인 프로세스에서 순서대로 shard 에 붙임
+      - flat / hashed + writer_threads > 0:
+                       tar 처럼 worker 가 bytes 를 돌려주고, add() 가 WriteBehind 에 넘겨
+                       스레드 풀이 비동기로 저장 (write_buffer 바이트까지 메모리에 쌓음)
+
+    add() 가 돌려주는 image_dir 기준 상대 경로를 JSON 의 image 에 쓴다.
+    sync() 의 반환값을 체크포인트에 저장했다가 resume 으로 넘기면 tar shard 도 이어서 쓴다.
+    write-behind 일 때는 mark() 의 Future 들이 끝난 뒤에 체크포인트를 커밋해야 한다.
+    """
+
+    def __init__(self, image_dir, layout="flat", shard_size=DEFAULT_SHARD_SIZE, resume=None,
+                 writer_threads=0, write_buffer=DEFAULT_WRITE_BUFFER):
+        if layout not in IMAGE_LAYOUTS:
+            raise ValueError(f"Unknown image layout: {layout!r} (expected one of {IMAGE_LAYOUTS})")
+        self.image_dir = image_dir
+        self.layout = layout
+        self._tar = ShardedTarWriter(image_dir, shard_size, resume) if layout == "tar" else None
+        self._wb = None
+        if self._tar is None and writer_threads > 0:
+            self._wb = WriteBehind(writer_threads, write_buffer)
+
+    def save_path(self, name):
+        if self._tar is not None or self._wb is not None:
+            return None
+        return os.path.join(self.image_dir, image_relpath(name, self.layout))
+
+    def add(self, name, data=None):
+        if self._tar is not None:
+            return self._tar.add(name, data)
+        relpath = image_relpath(name, self.layout)
+        if self._wb is not None:
+            self._wb.submit(os.path.join(self.image_dir, relpath), data)
+        return relpath
+
+    def mark(self):
+        """지난 mark() 이후 add() 한 이미지들의 쓰기 Future 목록 (write-behind 가 아니면 빈 리스트)."""
+        return self._wb.mark() if self._wb is not None else []
+
+    def sync(self):
+        return self._tar.sync() if self._tar is not None else None
+
+    def flush(self, durable=False):
+        """남은 이미지 쓰기를 끝내고, durable 이면 디스크까지 내린다 (데이터셋 끝에서 호출)."""
+        if self._tar is not None:
+            if durable:
+                self._tar.sync()
+        elif self._wb is not None:
+            self._wb.flush(durable)
+        elif durable:
+            os.sync()
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+        if self._wb is not None:
+            self._wb.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
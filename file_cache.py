@@ -0,0 +1,103 @@
+# file_cache.py
+"""
+파일별 마지막 처리 결과를 기억해 두는 영구 캐시
+(ov_data_add_placeholder.py, prompt_adder_for_ReCap.py 에서 사용).
+
+캐시 파일 (JSON) 에 {절대 경로: {"size", "mtime_ns", "hash", "result"}} 를 저장한다.
+  - size, mtime_ns 가 그대로면 stat 한 번으로 "안 바뀜" (파일을 읽지 않음)
+  - size 는 같은데 mtime 만 바뀌었으면 내용 해시(blake2b)를 다시 계산해 비교
+    (touch / rsync 로 시각만 바뀐 경우)
+  - 그 외에는 바뀐 것으로 보고 다시 처리
+
+    cache = ResultCache(default_cache_path("add_placeholder"), version=1)
+    entry = cache.get(path)
+    if entry is not None and is_unchanged(path, entry):
+        result = entry["result"]
+    else:
+        result = process(path)
+        cache.put(path, fingerprint(path), result)
+        cache.save()
+
+version 은 처리 로직이 바뀌었을 때 올려서 이전 결과를 버리는 용도.
+"""
+
+import hashlib
+import json
+import os
+
+HASH_CHUNK = 1 << 20
+
+
+def default_cache_path(name):
+    """~/.cache/llava-ov-data/{name}.json (OV_DATA_CACHE_DIR 로 폴더 변경 가능)"""
+    cache_dir = os.environ.get("OV_DATA_CACHE_DIR",
+                               os.path.join(os.path.expanduser("~"), ".cache", "llava-ov-data"))
+    return os.path.join(cache_dir, f"{name}.json")
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(path, known_hash=None):
+    """{"size", "mtime_ns", "hash"}. known_hash 가 있으면 해시를 다시 계산하지 않는다."""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": known_hash or file_hash(path)}
+
+
+def stat_matches(path, entry):
+    """stat 만으로 안 바뀐 게 확실한지 (파일을 읽지 않음)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]
+
+
+def is_unchanged(path, entry):
+    """entry 기록 이후 내용이 그대로인지. 시각만 바뀌었으면 해시로 확인한다."""
+    if stat_matches(path, entry):
+        return True
+    try:
+        if os.path.getsize(path) != entry["size"]:
+            return False
+    except FileNotFoundError:
+        return False
+    return file_hash(path) == entry["hash"]
+
+
+class ResultCache:
+    """
+    path:    캐시 JSON 파일
+    version: 저장된 version 과 다르면 기존 기록을 모두 무시
+    """
+
+    def __init__(self, path, version=1):
+        self.path = path
+        self.version = version
+        self.entries = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("version") == version:
+            self.entries = saved.get("entries", {})
+
+    def get(self, path):
+        return self.entries.get(os.path.abspath(path))
+
+    def put(self, path, fp, result):
+        """fp: fingerprint(path) 결과. 처리 후 파일이 바뀌었으면 바뀐 뒤의 fingerprint."""
+        self.entries[os.path.abspath(path)] = {**fp, "result": result}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
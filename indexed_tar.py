@@ -0,0 +1,190 @@
+# indexed_tar.py
+"""
+인덱스가 붙은 비압축 tar shard 쓰기/읽기.
+
+수십만~수백만 개의 이미지를 한 디렉토리에 낱개 파일로 두는 대신
+image/shard-00000.tar, shard-00001.tar … 에 순서대로 담고,
+shard 마다 member 의 (데이터 offset, 크기) 를 적은 sidecar 인덱스를 둔다.
+
+    shard-00000.tar       표준 tar (tar -tf 로 그대로 열림)
+    shard-00000.tar.idx   한 줄에 "name<TAB>offset<TAB>size"
+
+JSON 의 image 경로는 "…/image/shard-00000.tar/{name}" 형태로 쓰고,
+read_image_bytes() 가 그 경로를 인덱스 + mmap (또는 pread) 으로 풀어 bytes 를 돌려준다.
+(images_*.tar.gz 를 다시 묶은 "…/image/images_0.tar/{name}" 도 같은 방식, tar_extract 참고)
+"""
+
+import mmap
+import os
+import tarfile
+import time
+
+SHARD_PATTERN = "shard-{:05d}.tar"
+INDEX_SUFFIX = ".idx"
+DEFAULT_SHARD_SIZE = 1 << 30  # 1 GiB
+
+_BLOCK = tarfile.BLOCKSIZE
+
+
+def _tar_header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o644
+    # 긴 이름 / 비 ASCII 이름은 pax 확장 헤더로 들어감
+    return info.tobuf(format=tarfile.PAX_FORMAT)
+
+
+class IndexedTarWriter:
+    """
+    tar 파일 하나에 member 를 순서대로 추가하면서 sidecar 인덱스를 같이 쓴다.
+
+    resume: 이전 sync() 가 돌려준 {"tar_bytes", "idx_bytes"}. 주어지면 두 파일을
+            그 길이로 잘라낸 뒤 이어서 쓴다 (체크포인트 재시작용).
+    """
+
+    def __init__(self, tar_path, resume=None):
+        self.tar_path = tar_path
+        self.idx_path = tar_path + INDEX_SUFFIX
+        self._mtime = int(time.time())
+        if resume:
+            os.truncate(self.tar_path, resume["tar_bytes"])
+            os.truncate(self.idx_path, resume["idx_bytes"])
+            self._tar = open(self.tar_path, "r+b")
+            self._tar.seek(0, os.SEEK_END)
+            self._idx = open(self.idx_path, "a", encoding="utf-8")
+        else:
+            self._tar = open(self.tar_path, "wb")
+            self._idx = open(self.idx_path, "w", encoding="utf-8")
+        self.size = self._tar.tell()
+
+    def record_size(self, name, size):
+        """member 하나가 tar 에서 차지할 바이트 (헤더 + 데이터 + 블록 padding)."""
+        return len(_tar_header(name, size, self._mtime)) + size + (-size % _BLOCK)
+
+    def add(self, name, data, mtime=None):
+        """
+        data 를 member name 으로 추가하고 데이터의 (offset, size) 를 반환.
+        mtime: member 시각 (원본 tar 를 다시 묶을 때 넘기면 같은 입력 → 같은 tar). 없으면 writer 를 연 시각.
+        """
+        header = _tar_header(name, len(data), self._mtime if mtime is None else int(mtime))
+        offset = self.size + len(header)
+        pad = -len(data) % _BLOCK
+        self._tar.write(header)
+        self._tar.write(data)
+        self._tar.write(b"\0" * pad)
+        self.size = offset + len(data) + pad
+        self._idx.write(f"{name}\t{offset}\t{len(data)}\n")
+        return offset, len(data)
+
+    def add_alias(self, name, offset, size):
+        """tar 에는 쓰지 않고 인덱스에만 name → 이미 담긴 (offset, size) 를 추가 (링크 member 용)."""
+        self._idx.write(f"{name}\t{offset}\t{size}\n")
+
+    def sync(self):
+        """두 파일을 디스크까지 내리고 재시작 지점을 반환."""
+        for f in (self._tar, self._idx):
+            f.flush()
+            os.fsync(f.fileno())
+        return {"tar_bytes": self.size, "idx_bytes": os.fstat(self._idx.fileno()).st_size}
+
+    def close(self):
+        if self._tar.closed:
+            return
+        self._tar.write(b"\0" * (2 * _BLOCK))  # end-of-archive
+        self._tar.close()
+        self._idx.close()
+
+
+class ShardedTarWriter:
+    """
+    out_dir 아래에 shard_size 바이트를 넘지 않는 tar shard 들을 차례로 만든다
+    (헤더 / padding / end-of-archive 까지 포함한 파일 크기 기준. member 하나가 그보다 크면
+    그 member 만 든 shard 는 넘을 수 있음).
+    add() 는 JSON 에 쓸 "shard-00000.tar/{name}" 상대 경로를 반환한다.
+    """
+
+    def __init__(self, out_dir, shard_size=DEFAULT_SHARD_SIZE, resume=None):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        os.makedirs(out_dir, exist_ok=True)
+        self.shard = resume["shard"] if resume else 0
+        self._writer = self._open(self.shard, resume)
+
+    def _open(self, shard, resume=None):
+        return IndexedTarWriter(os.path.join(self.out_dir, SHARD_PATTERN.format(shard)), resume)
+
+    def add(self, name, data):
+        end = self._writer.size + self._writer.record_size(name, len(data)) + 2 * _BLOCK
+        if self._writer.size and end > self.shard_size:
+            self._writer.close()
+            self.shard += 1
+            self._writer = self._open(self.shard)
+        self._writer.add(name, data)
+        return f"{SHARD_PATTERN.format(self.shard)}/{name}"
+
+    def sync(self):
+        return {"shard": self.shard, **self._writer.sync()}
+
+    def close(self):
+        self._writer.close()
+
+
+def read_index(tar_path):
+    """sidecar 인덱스 → {name: (offset, size)}"""
+    index = {}
+    with open(tar_path + INDEX_SUFFIX, encoding="utf-8") as f:
+        for line in f:
+            name, offset, size = line.rstrip("\n").split("\t")
+            index[name] = (int(offset), int(size))
+    return index
+
+
+class IndexedTarReader:
+    """
+    sidecar 인덱스로 member 를 찾아 압축 해제 없이 바로 잘라 읽는다.
+    use_mmap=False 면 mmap 대신 os.pread 로 읽는다 (NFS 에서 큰 파일 mmap 이 부담스러울 때).
+    """
+
+    def __init__(self, tar_path, use_mmap=True):
+        self.tar_path = tar_path
+        self.index = read_index(tar_path)
+        self._f = open(tar_path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else None
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, name):
+        offset, size = self.index[name]
+        if self._mm is None:
+            return os.pread(self._f.fileno(), size, offset)
+        return self._mm[offset:offset + size]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._f.close()
+
+
+_readers = {}
+
+
+def read_image_bytes(path, use_mmap=True):
+    """
+    JSON 의 image 경로(데이터 루트와 join 한 것)를 bytes 로 읽는다.
+    "…/shard-00000.tar/{name}" 처럼 tar 안을 가리키면 인덱스로, 아니면 일반 파일로 읽는다.
+    tar 마다 처음 한 번만 인덱스를 읽고 reader 를 캐시한다 (use_mmap 은 그때의 값이 쓰임).
+    """
+    tar_path, sep, name = path.partition(".tar/")
+    if not sep:
+        with open(path, "rb") as f:
+            return f.read()
+    tar_path += ".tar"
+    reader = _readers.get(tar_path)
+    if reader is None:
+        reader = _readers[tar_path] = IndexedTarReader(tar_path, use_mmap)
+    return reader.read(name)
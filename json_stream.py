@@ -0,0 +1,246 @@
+# json_stream.py
+"""
+레코드를 만들어지는 즉시 파일로 흘려 쓰는 JSON / JSONL writer.
+
+전체 리스트를 메모리에 모았다가 json.dump 하던 방식과 달리 RSS 가 데이터 크기와
+무관하게 일정하다. fmt="json" 의 결과는 json.dump(records, f, indent=indent) 와
+같은 모양의 JSON 배열이고, fmt="jsonl" 은 한 줄에 레코드 하나다.
+
+    with JSONStreamWriter(path, fmt="json", indent=2) as writer:
+        for rec in records:
+            writer.write(rec)
+
+읽는 쪽은 iter_json_array() 가 최상위 JSON 배열의 원소를 하나씩 파싱해 돌려준다
+(chunk 단위로 읽으므로 메모리는 원소 하나 + chunk 크기 정도).
+
+    for item in iter_json_array(path):
+        ...
+"""
+
+import codecs
+import json
+import os
+import re
+
+FORMATS = ("json", "jsonl")
+WRITE_BATCH = 256  # indent 가 있는 JSON 배열은 이만큼 모아서 한 번에 인코딩
+
+
+def output_path(path, fmt):
+    """fmt 에 맞게 확장자(.json / .jsonl)를 붙이거나 바꾼다."""
+    root, ext = os.path.splitext(path)
+    if ext not in (".json", ".jsonl"):
+        root = path
+    return f"{root}.{fmt}"
+
+
+class JSONStreamWriter:
+    """
+    path:   출력 파일 경로
+    fmt:    "json" (배열) 또는 "jsonl"
+    indent: json.dump 의 indent. None 이면 compact (공백 없는 separators)
+    resume_offset, resume_count:
+            이전 실행의 커밋 지점(sync() 가 돌려준 바이트 수와 그때까지의 레코드 수).
+            주어지면 파일을 그 길이로 잘라낸 뒤 이어서 쓴다.
+
+    indent 가 있는 JSON 배열은 write() 한 레코드를 WRITE_BATCH 개씩 모아 한 번에 인코딩한다
+    (json 의 indent 인코더는 순수 Python 이라 레코드마다 부르는 비용이 큼).
+    그래서 write() 한 뒤에 레코드를 고치면 안 된다. sync() / close() 는 모인 것부터 쓴다.
+    """
+
+    def __init__(self, path, fmt="json", indent=2, ensure_ascii=False,
+                 resume_offset=None, resume_count=0):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown output format: {fmt!r} (expected one of {FORMATS})")
+        self.path = path
+        self.fmt = fmt
+        self.indent = None if fmt == "jsonl" else indent
+        self.ensure_ascii = ensure_ascii
+        self.count = 0
+        self._pad = "\n" + " " * self.indent if self.indent else "\n"
+        self._encoder = None
+        if self.fmt == "json" and self.indent:
+            self._encoder = json.JSONEncoder(ensure_ascii=ensure_ascii, indent=self.indent)
+        self._pending = []
+        if resume_offset is None:
+            self._f = open(path, "w", encoding="utf-8")
+        else:
+            os.truncate(path, resume_offset)
+            self._f = open(path, "a", encoding="utf-8")
+            self.count = resume_count
+
+    def _dumps(self, record):
+        if self.indent is None:
+            return json.dumps(record, ensure_ascii=self.ensure_ascii, separators=(",", ":"))
+        return json.dumps(record, ensure_ascii=self.ensure_ascii, indent=self.indent)
+
+    def write(self, record):
+        if self._encoder is not None:
+            self._pending.append(record)
+            self.count += 1
+            if len(self._pending) >= WRITE_BATCH:
+                self._write_pending()
+            return
+        text = self._dumps(record)
+        if self.fmt == "jsonl":
+            self._f.write(text + "\n")
+        else:
+            # 배열 원소는 한 단계 들여쓰기 (JSON 문자열 안에는 raw 개행이 없으므로 안전)
+            self._f.write(("[" if self.count == 0 else ",") + self._pad + text.replace("\n", self._pad))
+        self.count += 1
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        # "[\n  a,\n  b\n]" 에서 괄호만 떼면 배열 중간에 그대로 이어 붙일 수 있는 모양
+        text = self._encoder.encode(self._pending)[1:-2]
+        first = self.count == len(self._pending)
+        self._f.write(("[" if first else ",") + text)
+        self._pending.clear()
+
+    def sync(self):
+        """버퍼를 디스크까지 내리고 지금까지 쓴 바이트 수를 반환 (체크포인트용)."""
+        self._write_pending()
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return os.fstat(self._f.fileno()).st_size
+
+    def close(self, complete=True):
+        """complete=False 면 배열을 닫지 않아 중단된 출력이 완성본처럼 보이지 않게 한다."""
+        if self._f.closed:
+            return
+        self._write_pending()
+        if complete and self.fmt == "json":
+            self._f.write("[]" if self.count == 0 else "\n]")
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+
+
+READ_CHUNK = 1 << 20
+_NON_WS = re.compile(r"[^ \t\n\r]")
+_DELIMS = frozenset(" \t\n\r,]")  # 배열 원소 바로 뒤에 올 수 있는 글자
+
+
+class _TextBuffer:
+    """
+    바이너리 파일을 chunk 단위로 디코딩해 붙여 가며 파싱 위치(pos)를 관리.
+    encoding="latin-1" 이면 글자 하나가 바이트 하나라서 base + pos 가 곧 파일 오프셋이다
+    (JSON 의 구조 글자는 모두 ASCII 이므로 경계 판단은 UTF-8 로 읽을 때와 같음).
+    """
+
+    def __init__(self, f, chunk_size, progress, encoding="utf-8"):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._progress = progress
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self.buf = ""
+        self.base = 0  # buf[0] 의 (디코딩된 글자 기준) 절대 위치
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """chunk 를 더 읽어 붙인다 (이미 읽은 부분은 버림). 더 읽을 게 없으면 False."""
+        if self.eof:
+            return False
+        # 원소 하나가 chunk 보다 크면 읽는 양을 늘려서 재시도 횟수를 log 로 줄임
+        raw = self._f.read(max(self._chunk_size, len(self.buf) - self.pos))
+        if self._progress is not None:
+            self._progress.update(len(raw))
+        self.eof = not raw
+        self.buf = self.buf[self.pos:] + self._decoder.decode(raw, final=self.eof)
+        self.base += self.pos
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """공백을 건너뛰고 다음 글자를 반환 (파일 끝이면 "")."""
+        while True:
+            m = _NON_WS.search(self.buf, self.pos)
+            if m:
+                self.pos = m.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self.fill():
+                return ""
+
+    def decode(self, decoder):
+        self.peek()  # raw_decode 는 앞 공백을 건너뛰지 않음
+        self.start = self.base + self.pos  # fill() 은 pos 앞만 버리므로 절대 위치는 그대로
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue  # 원소가 chunk 경계에서 잘림
+            if (end == len(self.buf) or self.buf[end] not in _DELIMS) and self.fill():
+                continue  # 숫자 같은 값이 chunk 경계에서 잘렸을 수 있음 (e.g. "1.5" | "e10")
+            self.pos = end
+            return obj
+
+
+def is_json_array(path):
+    """파일의 최상위 JSON 값이 배열인지 (첫 글자만 보고) 판단."""
+    with open(path, "rb") as f:
+        return _TextBuffer(f, 4096, None).peek() == "["
+
+
+def _iter_array(path, chunk_size, progress, encoding):
+    """최상위 배열의 원소를 (값, 시작 위치, 끝 위치) 로 yield. 위치는 디코딩된 글자 기준."""
+    decoder = json.JSONDecoder()
+    with open(path, "rb") as f:
+        src = _TextBuffer(f, chunk_size, progress, encoding)
+        if src.peek() != "[":
+            raise ValueError(f"{path}: top-level JSON value is not an array")
+        src.pos += 1
+        if src.peek() == "]":
+            src.pos += 1
+        else:
+            while True:
+                obj = src.decode(decoder)
+                yield obj, src.start, src.base + src.pos
+                c = src.peek()
+                src.pos += 1
+                if c == "]":
+                    break
+                if c != ",":
+                    raise ValueError(f"{path}: expected ',' or ']' but got {c!r}")
+        if src.peek():
+            raise ValueError(f"{path}: extra data after the top-level array")
+
+
+def iter_json_array(path, chunk_size=READ_CHUNK, progress=None):
+    """
+    최상위가 JSON 배열인 파일의 원소를 앞에서부터 하나씩 yield.
+    progress: 읽은 바이트 수만큼 update() 할 tqdm (선택)
+    배열이 아니거나 문법이 틀리면 ValueError (json.JSONDecodeError 포함).
+    """
+    for obj, _, _ in _iter_array(path, chunk_size, progress, "utf-8"):
+        yield obj
+
+
+def iter_json_array_spans(path, chunk_size=READ_CHUNK, progress=None):
+    """
+    최상위 JSON 배열의 원소마다 파일 안의 (바이트 오프셋, 바이트 길이) 를 yield.
+    f.seek(offset); json.loads(f.read(length)) 로 그 원소 하나만 다시 읽을 수 있다.
+    """
+    for _, start, end in _iter_array(path, chunk_size, progress, "latin-1"):
+        yield start, end - start
+
+
+def iter_jsonl_spans(path, progress=None):
+    """JSONL 파일의 비어 있지 않은 줄마다 (바이트 오프셋, 바이트 길이) 를 yield (줄바꿈 제외)."""
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if progress is not None:
+                progress.update(len(line))
+            body = line.strip()
+            if body:
+                yield offset + line.index(body[:1]), len(body)
+            offset += len(line)
@@ -0,0 +1,314 @@
+# mixture_index.py
+"""
+yaml mixture (datasets: - json_path / sampling_strategy) 를 한 번 풀어서
+선택된 레코드의 위치만 담은 바이너리 인덱스로 저장하고, 그 인덱스로 레코드를 읽는다.
+
+학습 때마다 모든 JSON 을 json.load 해서 sampling_strategy 를 적용하는 대신,
+빌드할 때 한 번만 각 JSON 의 원소 바이트 위치를 훑어 두고
+로더는 선택된 원소의 바이트만 pread 해서 파싱한다 (선택 안 된 원소는 읽지도 않음).
+
+    python mixture_index.py build OneVisionData/single_image.yaml -o single_image.mix --shuffle --seed 42
+    python mixture_index.py show single_image.mix
+
+    with MixtureIndex("single_image.mix") as mix:
+        len(mix), mix.counts()
+        mix[123]                 # dict (레코드 하나)
+        for rec in mix: ...      # 인덱스 순서대로
+
+파일 구성
+    single_image.mix        헤더(16B) + offset(uint64 × N) + length(uint32 × N) + dataset id(uint32 × N)
+    single_image.mix.json   datasets (json_path, sampling_strategy, size, mtime_ns, total, selected), seed 등
+
+sampling_strategy 는 LLaVA-NeXT 와 같은 규칙: all / first:N / end:N / random:N (N 은 개수 또는 "10%", 올림).
+random 은 LLaVA 처럼 전역 random 이 아니라 --seed 와 dataset 순서로 고정된 난수를 쓴다.
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+from tqdm import tqdm
+
+from json_stream import iter_json_array_spans, iter_jsonl_spans
+
+MAGIC = b"MIXIDX01"
+HEADER = struct.Struct("<8sQ")  # magic, 레코드 수
+STRATEGIES = ("first", "end", "random")
+
+
+def meta_path(index_path):
+    return index_path + ".json"
+
+
+def parse_strategy(strategy):
+    """"all" → ("all", None), "first:10%" → ("first", "10%"). 따옴표가 남아 있어도 받아 줌."""
+    s = str(strategy if strategy is not None else "all").strip().strip("\"'")
+    if s == "all":
+        return "all", None
+    kind, _, number = s.partition(":")
+    if kind not in STRATEGIES or not number:
+        raise ValueError(f"unknown sampling_strategy: {strategy!r}")
+    return kind, number
+
+
+def select_indices(total, strategy, rng):
+    """total 개 중 strategy 가 고르는 원소 번호 (LLaVA-NeXT 와 같은 순서)."""
+    kind, number = parse_strategy(strategy)
+    if kind == "all":
+        return range(total)
+    if number.endswith("%"):
+        k = math.ceil(float(number[:-1]) * total / 100)
+    else:
+        k = int(number)
+    k = min(k, total)
+    if kind == "first":
+        return range(k)
+    if kind == "end":
+        return range(total - k, total)
+    order = list(range(total))
+    rng.shuffle(order)
+    return order[:k]
+
+
+def scan_dataset(json_path):
+    """
+    JSON 배열(또는 .jsonl)의 원소마다 (오프셋, 길이) 를 구한다.
+    반환: (size, mtime_ns, offsets array('Q'), lengths array('I'))
+    """
+    st = os.stat(json_path)
+    spans = iter_jsonl_spans(json_path) if json_path.endswith(".jsonl") else iter_json_array_spans(json_path)
+    offsets, lengths = array("Q"), array("I")
+    for offset, length in spans:
+        offsets.append(offset)
+        lengths.append(length)
+    # 훑는 사이에 파일이 바뀌었으면 위치를 믿을 수 없음
+    st2 = os.stat(json_path)
+    if (st.st_size, st.st_mtime_ns) != (st2.st_size, st2.st_mtime_ns):
+        raise RuntimeError(f"{json_path} changed while scanning")
+    return st.st_size, st.st_mtime_ns, offsets, lengths
+
+
+def _iter_scans(paths, workers):
+    """(path, scan_dataset 결과 또는 예외) 를 끝나는 순서대로 yield."""
+    if workers <= 1:
+        for p in paths:
+            try:
+                yield p, scan_dataset(p)
+            except Exception as e:
+                yield p, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(scan_dataset, p): p for p in paths}
+        for fut in as_completed(futures):
+            try:
+                yield futures[fut], fut.result()
+            except Exception as e:
+                yield futures[fut], e
+
+
+def load_mixture(yaml_path):
+    """yaml 의 datasets 를 [(절대 json_path, sampling_strategy)] 로."""
+    with open(yaml_path, "r", encoding="utf-8") as yf:
+        cfg = yaml.safe_load(yf)
+    datasets = []
+    for ds in cfg.get("datasets", []) or []:
+        jp = ds.get("json_path")
+        if not jp:
+            continue
+        strategy = ds.get("sampling_strategy", "all")
+        parse_strategy(strategy)  # 잘못된 값은 훑기 전에 알림
+        datasets.append((os.path.abspath(jp), strategy))
+    return datasets
+
+
+def build_index(yaml_path, index_path, seed=0, shuffle=False, workers=1):
+    """
+    yaml mixture 를 풀어 index_path (+ .json) 에 저장하고 meta dict 를 반환.
+    json_path 가 없거나 파싱에 실패한 dataset 이 있으면 인덱스를 쓰지 않고 RuntimeError.
+    """
+    datasets = load_mixture(yaml_path)
+
+    # 1) 각 JSON 의 원소 위치 훑기 (같은 파일이 여러 번 나와도 한 번만)
+    unique = sorted({jp for jp, _ in datasets}, key=lambda p: os.path.getsize(p) if os.path.isfile(p) else 0,
+                    reverse=True)  # 큰 파일부터
+    scans, failed = {}, []
+    for jp, result in tqdm(_iter_scans(unique, workers), total=len(unique), desc="Scanning"):
+        if isinstance(result, Exception):
+            tqdm.write(f"[FAIL] {jp}: {result!r}")
+            failed.append(jp)
+        else:
+            scans[jp] = result
+    if failed:
+        raise RuntimeError(f"{len(failed)} datasets could not be scanned")
+
+    # 2) sampling_strategy 적용 (yaml 순서대로 이어 붙임)
+    offsets, lengths, ids = array("Q"), array("I"), array("I")
+    entries = []
+    for ds_id, (jp, strategy) in enumerate(datasets):
+        size, mtime_ns, ds_offsets, ds_lengths = scans[jp]
+        total = len(ds_offsets)
+        picked = select_indices(total, strategy, random.Random(f"{seed}:{ds_id}"))
+        for i in picked:
+            offsets.append(ds_offsets[i])
+            lengths.append(ds_lengths[i])
+        ids.extend(array("I", [ds_id]) * len(picked))
+        entries.append({"json_path": jp, "sampling_strategy": strategy, "size": size,
+                        "mtime_ns": mtime_ns, "total": total, "selected": len(picked)})
+        print(f"{os.path.basename(jp)}: {len(picked):,} / {total:,} ({strategy})")
+
+    # 3) 전체 순서 섞기 (선택)
+    if shuffle:
+        order = list(range(len(offsets)))
+        random.Random(seed).shuffle(order)
+        offsets = array("Q", (offsets[i] for i in order))
+        lengths = array("I", (lengths[i] for i in order))
+        ids = array("I", (ids[i] for i in order))
+
+    # 4) 임시 파일에 쓰고 교체 (메타는 인덱스 다음에 교체 — 메타가 있으면 인덱스도 완성본)
+    meta = {"version": 1, "yaml": os.path.abspath(yaml_path), "seed": seed, "shuffled": shuffle,
+            "count": len(offsets), "byteorder": sys.byteorder, "datasets": entries}
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    if os.path.exists(meta_path(index_path)):
+        os.remove(meta_path(index_path))
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(offsets)))
+        offsets.tofile(f)
+        lengths.tofile(f)
+        ids.tofile(f)
+    os.replace(tmp_path, index_path)
+    with open(meta_path(index_path) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    os.replace(meta_path(index_path) + ".tmp", meta_path(index_path))
+    return meta
+
+
+class MixtureIndex:
+    """
+    build_index 가 만든 인덱스를 mmap 으로 열어 레코드를 읽는다.
+
+    check: dataset JSON 의 size / mtime 이 빌드 때와 다르면 ValueError (오프셋이 틀어졌으므로 다시 빌드)
+    파일 핸들은 처음 읽을 때 연다. pread 만 쓰므로 fork 된 DataLoader worker 에서 같이 써도 된다.
+    """
+
+    def __init__(self, index_path, check=True):
+        self.index_path = index_path
+        with open(meta_path(index_path), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("byteorder", sys.byteorder) != sys.byteorder:
+            raise ValueError(f"{index_path}: built on a {self.meta['byteorder']}-endian machine")
+        self.datasets = self.meta["datasets"]
+        if check:
+            for ds in self.datasets:
+                st = os.stat(ds["json_path"])
+                if (st.st_size, st.st_mtime_ns) != (ds["size"], ds["mtime_ns"]):
+                    raise ValueError(f"{ds['json_path']} changed since {index_path} was built; rebuild it")
+        self._open()
+
+    def _open(self):
+        with open(self.index_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or n != self.meta["count"]:
+            raise ValueError(f"{self.index_path}: not a mixture index or does not match its .json")
+        mv = memoryview(self._mm)
+        pos = HEADER.size
+        self.offsets = mv[pos:pos + 8 * n].cast("Q")
+        pos += 8 * n
+        self.lengths = mv[pos:pos + 4 * n].cast("I")
+        pos += 4 * n
+        self.dataset_ids = mv[pos:pos + 4 * n].cast("I")
+        self._fds = {}
+
+    def __getstate__(self):
+        return {"index_path": self.index_path, "meta": self.meta, "datasets": self.datasets}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def counts(self):
+        """
+        dataset 마다 선택된 레코드 수 (list, yaml 의 datasets 순서 = dataset id).
+        같은 json_path 가 yaml 에 두 번 있으면 각각 따로 센다.
+        """
+        return [ds["selected"] for ds in self.datasets]
+
+    def read_bytes(self, i):
+        """i 번째 레코드의 JSON 원문 bytes 와 dataset id."""
+        ds_id = self.dataset_ids[i]
+        fd = self._fds.get(ds_id)
+        if fd is None:
+            fd = self._fds[ds_id] = os.open(self.datasets[ds_id]["json_path"], os.O_RDONLY)
+        return os.pread(fd, self.lengths[i], self.offsets[i]), ds_id
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return json.loads(self.read_bytes(i)[0])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield json.loads(self.read_bytes(i)[0])
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+        self.offsets.release()
+        self.lengths.release()
+        self.dataset_ids.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="yaml mixture 의 sampling_strategy 를 바이너리 레코드 인덱스로 만듭니다.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="yaml → 인덱스")
+    p_build.add_argument("yaml", help="datasets: - json_path / sampling_strategy 목록 yaml")
+    p_build.add_argument("-o", "--output", default=None, help="인덱스 경로 (기본: yaml 옆의 {이름}.mix)")
+    p_build.add_argument("--seed", type=int, default=0, help="random:N 과 --shuffle 에 쓸 시드")
+    p_build.add_argument("--shuffle", action="store_true", help="선택된 레코드 전체를 시드로 미리 섞음")
+    p_build.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                         help="동시에 훑을 JSON 수 (프로세스 풀)")
+
+    p_show = sub.add_parser("show", help="인덱스의 dataset 별 개수 출력")
+    p_show.add_argument("index")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        output = args.output or os.path.splitext(args.yaml)[0] + ".mix"
+        try:
+            meta = build_index(args.yaml, output, seed=args.seed, shuffle=args.shuffle, workers=args.workers)
+        except RuntimeError as e:
+            raise SystemExit(str(e))
+        print(f"[DONE] {meta['count']:,} records from {len(meta['datasets'])} datasets -> {output}")
+    else:
+        with MixtureIndex(args.index, check=False) as mix:
+            for ds in mix.datasets:
+                print(f"{ds['selected']:>12,} / {ds['total']:>12,}  {ds['sampling_strategy']:<12} {ds['json_path']}")
+            print(f"{len(mix):>12,} records (seed={mix.meta['seed']}, shuffled={mix.meta['shuffled']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,187 @@
 import os
-import json
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import yaml
 from tqdm import tqdm
 
-def process_json(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    print(f"Succesfully open {os.path.basename(path)}")
-
-    added = 0
-    dup_cleaned = 0
-
-    for item in tqdm(data, desc=f"Processing {os.path.basename(path)}"):
-        convs = item.get('conversations')
-        # only process items that have an image field and a conversations list
-        if 'image' in item and isinstance(convs, list):
-            # find all human conversation indices
-            human_idxs = [i for i, c in enumerate(convs) if c.get('from') == 'human']
-            if not human_idxs:
-                continue
-
-            # count total '<image>' across all human convs
-            total_imgs = sum(
-                convs[i].get('value', '').count('<image>')
-                for i in human_idxs
-            )
-
-            if total_imgs == 0:
-                # no placeholder at all: add to first human conv
-                idx = human_idxs[0]
-                convs[idx]['value'] = '<image>\n' + convs[idx].get('value', '')
-                added += 1
-
-            elif total_imgs > 1:
-                # more than one placeholder: remove all, then add one at first
-                for i in human_idxs:
-                    cleaned = convs[i]['value'].replace('<image>', '').strip()
-                    convs[i]['value'] = cleaned
-                first = human_idxs[0]
-                convs[first]['value'] = '<image>\n' + convs[first]['value']
-                dup_cleaned += 1
+from file_cache import ResultCache, default_cache_path, fingerprint, is_unchanged, stat_matches
+from json_stream import JSONStreamWriter, iter_json_array
+
+CACHE_VERSION = 1  # fix_placeholders 로직이 바뀌면 올려서 캐시를 무효화
+
+
+def fix_placeholders(item):
+    """
+    image 가 있는 item 의 human 대화에 '<image>' 가 정확히 하나 (첫 human 맨 앞) 있게 고친다.
+    item 을 제자리에서 고치고 "added" / "dup_cleaned" / None (그대로) 을 반환.
+    """
+    convs = item.get('conversations')
+    # only process items that have an image field and a conversations list
+    if 'image' not in item or not isinstance(convs, list):
+        return None
+
+    # find all human conversation indices
+    human_idxs = [i for i, c in enumerate(convs) if c.get('from') == 'human']
+    if not human_idxs:
+        return None
+
+    # count total '<image>' across all human convs
+    total_imgs = sum(
+        convs[i].get('value', '').count('<image>')
+        for i in human_idxs
+    )
+
+    if total_imgs == 0:
+        # no placeholder at all: add to first human conv
+        idx = human_idxs[0]
+        convs[idx]['value'] = '<image>\n' + convs[idx].get('value', '')
+        return "added"
+
+    if total_imgs > 1:
+        # more than one placeholder: remove all, then add one at first
+        for i in human_idxs:
+            cleaned = convs[i]['value'].replace('<image>', '').strip()
+            convs[i]['value'] = cleaned
+        first = human_idxs[0]
+        convs[first]['value'] = '<image>\n' + convs[first]['value']
+        return "dup_cleaned"
+
+    return None
+
+
+def _rewrite(path):
+    """고친 내용을 임시 파일에 스트리밍으로 쓰고 원자적으로 교체 (중간에 죽어도 원본은 그대로)."""
+    tmp_path = path + ".tmp"
+    try:
+        with JSONStreamWriter(tmp_path, "json", indent=2, ensure_ascii=False) as out:
+            for item in iter_json_array(path):
+                fix_placeholders(item)
+                out.write(item)
+            out.sync()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def process_json(path, scan_only=False):
+    """
+    path 를 한 번 훑어 고칠 item 수를 세고, 고칠 게 있고 scan_only 가 아니면 다시 읽으며 덮어쓴다.
+    item 을 하나씩 읽으므로 파일이 커도 메모리는 일정하다. (added, dup_cleaned) 를 반환.
+    """
+    counts = Counter(fix_placeholders(item) for item in iter_json_array(path))
 
     # overwrite only if we made changes
-    if added or dup_cleaned:
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    if not scan_only and (counts["added"] or counts["dup_cleaned"]):
+        _rewrite(path)
+
+    return counts["added"], counts["dup_cleaned"]
+
+
+def _needs_work(counts, scan_only):
+    return not scan_only and any(counts)
+
+
+def process_cached(path, scan_only=False, entry=None):
+    """
+    entry (캐시 기록) 이후 내용이 그대로면 파싱하지 않고 기록된 결과를 쓴다 (고칠 게 남은 경우 제외).
+    반환: (added, dup_cleaned), 캐시에 넣을 (fingerprint, 결과), 캐시 사용 여부
+    """
+    if entry is not None and is_unchanged(path, entry) and not _needs_work(entry["result"], scan_only):
+        return tuple(entry["result"]), (fingerprint(path, entry["hash"]), entry["result"]), True
 
-    print(f"{os.path.basename(path)}: {added} placeholders added, {dup_cleaned} items cleaned")
+    added, dup_cleaned = process_json(path, scan_only)
+    # 고쳐 쓴 파일은 다시 돌려도 바뀌는 게 없으므로 새 내용에 대해서는 (0, 0) 을 기록
+    result = [0, 0] if _needs_work((added, dup_cleaned), scan_only) else [added, dup_cleaned]
+    return (added, dup_cleaned), (fingerprint(path), result), False
+
+
+def _iter_results(jobs, workers, scan_only):
+    """
+    jobs: [(path, 캐시 기록 또는 None)]. (path, process_cached 결과 또는 예외) 를 끝나는 순서대로 yield.
+    workers > 1 이면 프로세스 풀.
+    """
+    if workers <= 1:
+        for jp, entry in jobs:
+            try:
+                yield jp, process_cached(jp, scan_only, entry)
+            except Exception as e:
+                yield jp, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_cached, jp, scan_only, entry): jp for jp, entry in jobs}
+        for fut in as_completed(futures):
+            try:
+                yield futures[fut], fut.result()
+            except Exception as e:
+                yield futures[fut], e
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="yaml 의 json_path 들에서 human 대화의 <image> placeholder 를 하나로 맞춥니다."
+    )
+    parser.add_argument("--yaml", default="single_image.yaml", help="datasets: - json_path 목록 yaml")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="동시에 처리할 파일 수 (프로세스 풀)")
+    parser.add_argument("--scan-only", action="store_true",
+                        help="파일은 고치지 않고 added / dup_cleaned 개수만 보고")
+    parser.add_argument("--cache", default=default_cache_path("add_placeholder"),
+                        help="파일별 (크기, mtime, 내용 해시, 결과) 캐시 경로")
+    parser.add_argument("--no-cache", action="store_true", help="캐시를 무시하고 모든 파일을 다시 읽음")
+    args = parser.parse_args()
+
     # 1) load YAML
-    with open('single_image.yaml', 'r', encoding='utf-8') as yf:
+    with open(args.yaml, 'r', encoding='utf-8') as yf:
         cfg = yaml.safe_load(yf)
 
-    # 2) iterate over datasets
+    paths = []
     for ds in cfg.get('datasets', []):
         jp = ds.get('json_path')
         if jp and os.path.isfile(jp):
-            process_json(jp)
+            paths.append(jp)
+        elif jp:
+            print(f"[SKIP] {jp} not found")
+    paths.sort(key=os.path.getsize, reverse=True)  # 큰 파일부터 (마지막에 큰 파일 하나만 남지 않게)
+
+    # 2) stat 이 지난번 처리 때와 같고 고칠 게 없던 파일은 바로 건너뜀 (파일을 열지 않음)
+    cache = ResultCache(args.cache, version=CACHE_VERSION)
+    totals = Counter()
+    jobs, unchanged = [], 0
+    for jp in paths:
+        entry = None if args.no_cache else cache.get(jp)
+        if entry is not None and stat_matches(jp, entry) and not _needs_work(entry["result"], args.scan_only):
+            added, dup_cleaned = entry["result"]
+            totals.update(added=added, dup_cleaned=dup_cleaned)
+            unchanged += 1
+            continue
+        jobs.append((jp, entry))
+    if unchanged:
+        print(f"[CACHE] {unchanged} files unchanged since the last run, skipped")
+
+    # 3) process the rest concurrently
+    failed = []
+    for jp, result in tqdm(_iter_results(jobs, args.workers, args.scan_only), total=len(jobs), desc="Files"):
+        if isinstance(result, Exception):  # 한 파일이 실패해도 나머지는 계속
+            tqdm.write(f"[FAIL] {jp}: {result!r}")
+            failed.append(jp)
+            continue
+        (added, dup_cleaned), (fp, cache_result), from_cache = result
+        cache.put(jp, fp, cache_result)
+        cache.save()
+        totals.update(added=added, dup_cleaned=dup_cleaned)
+        note = " (content unchanged, cached)" if from_cache else ""
+        tqdm.write(f"{os.path.basename(jp)}: {added} placeholders added, {dup_cleaned} items cleaned{note}")
+
+    mode = "would be changed (scan only)" if args.scan_only else "changed"
+    print(f"[DONE] {len(paths) - len(failed)} files: {totals['added']:,} placeholders added, "
+          f"{totals['dup_cleaned']:,} items cleaned {mode}")
+    if failed:
+        raise SystemExit(f"{len(failed)} files failed")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -5,86 +5,82 @@
 # ./ov_data_imagenet2backbone.py \
 #   --source-root /mnt/ssd/junha/dataset_origin/OneVisionData \
 #   --target-root /mnt/ssd/junha/dataset/OneVisionData \
-#   --cache-dir /mnt/ssd/junha/.cache/huggingface
+#   --workers 16 \
+#   --concurrent-datasets 4
 
 import os
 import glob
 import argparse
-import json
 import csv
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 
-from datasets import load_dataset, Image as HFImage
 from tqdm import tqdm
-from PIL import Image, UnidentifiedImageError
 
-def convert_dataset(source_root: str, target_base: str, cache_dir: str):
+from convert_engine import convert_parquet, format_stage_report, write_bad_samples
+from convert_utils import DEFAULT_WRITE_BUFFER, IMAGE_LAYOUTS, parquet_size
+from convert_checkpoint import ConvertCheckpoint, committed_rows, load_manifest
+from indexed_tar import DEFAULT_SHARD_SIZE
+from json_stream import FORMATS, output_path
+
+def find_parquet_files(source_root: str):
+    """parquet 파일 검색 (폴더 직속 또는 재귀)"""
+    parquet_files = sorted(glob.glob(os.path.join(source_root, "*.parquet")))
+    if not parquet_files:
+        parquet_files = sorted(glob.glob(os.path.join(source_root, "**", "*.parquet"), recursive=True))
+    return parquet_files
+
+
+def convert_dataset(
+    source_root: str,
+    target_base: str,
+    workers: int = 1,
+    passthrough: bool = False,
+    output_format: str = "json",
+    compact: bool = False,
+    restart: bool = False,
+    image_layout: str = "flat",
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    writer_threads: int = 0,
+    write_buffer: int = DEFAULT_WRITE_BUFFER,
+    durable: bool = False,
+    executor=None,
+    progress=None,
+):
     """
     source_root: 원본 parquet 폴더 (e.g. /mnt/ssd/.../OneVisionData/ai2d(cauldron,llava_format))
     target_base: 변환된 결과가 저장될 최상위 디렉토리 
                  (e.g. /mnt/ssd/junha/dataset/OneVisionData)
-    cache_dir:   HuggingFace Dataset 캐시 디렉토리
+    workers:     이미지 디코딩/저장 프로세스 수 (1 이면 메인 프로세스에서 처리)
+    passthrough: 이미 baseline RGB JPEG 인 이미지는 재인코딩 없이 원본 bytes 를 그대로 저장
+    output_format: "json" (배열) 또는 "jsonl"
+    compact:     True 면 indent 없이 한 레코드를 한 줄로 씀
+    restart:     True 면 체크포인트를 무시하고 처음부터 변환
+    image_layout: "flat" (image/{id}.jpg), "hashed" (image/ab/cd/{id}.jpg),
+                 "tar" (image/shard-00000.tar/{id}.jpg + .idx 인덱스)
+    shard_size:  tar 레이아웃의 shard 최대 바이트 수
+    writer_threads: > 0 이면 flat / hashed 이미지를 이 수만큼의 write-behind 스레드가 저장
+                 (worker 는 인코딩만 하고, NFS 처럼 파일당 지연이 큰 타겟에서 쓰기를 겹침)
+    write_buffer: write-behind 가 메모리에 쥐고 있을 최대 이미지 바이트
+    durable:     데이터셋 끝에서 이미지/디렉토리를 fsync 한 뒤 완료로 표시
+    executor:    여러 데이터셋이 공유하는 ProcessPoolExecutor (없으면 workers 개로 새로 만듦)
+    progress:    전체 코퍼스 진행률 tqdm (없으면 폴더별 tqdm 을 만듦)
+
+    반환: convert_parquet 의 결과 dict (건너뛴 폴더면 None)
     """
     base_name   = os.path.basename(source_root.rstrip("/"))
     target_root = os.path.join(target_base, base_name)
     image_dir   = os.path.join(target_root, "image")
     os.makedirs(image_dir, exist_ok=True)
 
-    # parquet 파일 검색 (폴더 직속 또는 재귀)
-    parquet_files = sorted(glob.glob(os.path.join(source_root, "*.parquet")))
-    if not parquet_files:
-        parquet_files = sorted(glob.glob(os.path.join(source_root, "**", "*.parquet"), recursive=True))
+    parquet_files = find_parquet_files(source_root)
     if not parquet_files:
         print(f"[SKIP] '{base_name}'에 parquet 파일이 없습니다.")
         return
 
     print(f"[START] Converting '{base_name}', {len(parquet_files)} files…")
 
-    # ── 1) 자동 디코딩 끄기 ─────────────────────────────────────────────
-    ds = (
-        load_dataset(
-            "parquet",
-            data_files={"train": parquet_files},
-            split="train",
-            cache_dir=cache_dir,
-        )
-        .cast_column("image", HFImage(decode=False))  # decode=False!  🔑
-    )
-
-    converted, bad_samples = [], []
-
-    for row in tqdm(ds, desc=f"  → {base_name}"):
-        rec = {
-            "id": row["id"],
-            "conversations": row.get("conversations", []),
-        }
-
-        # 이미지 처리 (lazy‑decode & 오류 처리)
-        bytes_ = row["image"].get("bytes") if row.get("image") else None
-        if bytes_:
-            try:
-                img = Image.open(BytesIO(bytes_))
-                img.load()  # 실제 디코딩 ➜ 오류가 여기서 발생하면 except 로
-
-                # JPEG에 쓸 수 없는 모드(RGBA 등)는 RGB 변환
-                if getattr(img, "mode", "RGB") != "RGB":
-                    img = img.convert("RGB")
-
-                img_fname = f"{row['id']}.jpg"
-                rec["image"] = os.path.join("OneVisionData", base_name, "image", img_fname)
-                
-                save_path = os.path.join(image_dir, img_fname)
-                os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                
-                img.save(os.path.join(image_dir, img_fname))
-
-            except (UnidentifiedImageError, OSError) as e:
-                bad_samples.append({"id": row["id"], "reason": str(e)})
-                continue  # 해당 샘플은 건너뜀
-
-        converted.append(rec)
-
-    # ── 2) JSON 파일 저장 ─────────────────────────────────────────────
+    # ── 1) JSON 출력 경로 ─────────────────────────────────────────────
     # CSV에 정의된 폴더→JSON 이름 매핑 로드
     json_mapping = {}
     mapping_csv = os.path.join(os.path.dirname(__file__), "OneVisionData", "JSON_Mapping.csv")
@@ -94,20 +90,110 @@ def convert_dataset(source_root: str, target_base: str, cache_dir: str):
                 json_mapping[row["folder_name"]] = row["json_file"]
 
     json_name = json_mapping.get(base_name, f"{base_name}.json")
-    json_path = os.path.join(target_root, json_name)
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(converted, f, ensure_ascii=False, indent=2)
+    json_path = output_path(os.path.join(target_root, json_name), output_format)
+
+    # 체크포인트: 이전 실행이 중단됐으면 커밋된 row group 다음부터 이어서 변환
+    ckpt = ConvertCheckpoint(
+        target_root,
+        parquet_files,
+        {
+            "json_path": json_path,
+            "output_format": output_format,
+            "compact": compact,
+            "passthrough": passthrough,
+            "image_layout": image_layout,
+            "shard_size": shard_size,
+        },
+        restart=restart,
+    )
+    if ckpt.complete:
+        print(f"[SKIP] '{base_name}' already converted (checkpoint complete)")
+        return
+    if ckpt.resuming:
+        print(f"[RESUME] '{base_name}': {ckpt.rows_done:,} rows already committed")
+
+    # ── 2) read → encode → write 파이프라인으로 변환 (convert_engine) ────
+    #      parquet 은 row group 단위로 직접 읽고 (HF 캐시 미사용),
+    #      레코드는 만들어지는 대로 JSON 파일에 바로 씀
+    result = convert_parquet(
+        parquet_files,
+        ckpt,
+        json_path,
+        image_dir,
+        os.path.join("OneVisionData", base_name, "image"),
+        output_format=output_format,
+        indent=None if compact else 2,
+        image_layout=image_layout,
+        shard_size=shard_size,
+        workers=workers,
+        passthrough=passthrough,
+        writer_threads=writer_threads,
+        write_buffer=write_buffer,
+        durable=durable,
+        executor=executor,
+        progress=progress,
+        desc=f"  → {base_name}",
+    )
 
     # ── 3) 깨진 샘플 로그 저장 ────────────────────────────────────────
+    bad_samples = result["bad_samples"]
     if bad_samples:
         log_path = os.path.join(target_root, f"{base_name}_bad_samples.csv")
-        with open(log_path, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=["id", "reason"])
-            writer.writeheader()
-            writer.writerows(bad_samples)
+        write_bad_samples(log_path, bad_samples)
         print(f"[WARN] {len(bad_samples):,} bad samples logged to {log_path}")
 
-    print(f"[DONE] '{base_name}': {len(converted):,} good samples → {json_path}")
+    print(f"[DONE] '{base_name}': {result['count']:,} good samples → {json_path}")
+    print(f"       {format_stage_report(result)}")
+    return result
+
+
+def convert_all(source_dirs, target_base: str, workers: int = 1, concurrent: int = 1, **kwargs):
+    """
+    여러 데이터셋 폴더를 큰 것부터 concurrent 개씩 동시에 변환한다.
+
+    - 폴더 크기는 parquet footer 메타데이터(row group 바이트 합계)로 계산하고,
+      이미 커밋된 체크포인트 row 는 남은 작업량에서 뺀다.
+    - 이미지 디코딩/저장은 모든 데이터셋이 workers 개짜리 프로세스 풀 하나를 공유하므로
+      작은 폴더가 끝나면 남은 큰 폴더가 풀 전체를 쓰게 된다 (전역 worker 예산).
+    - 진행률/ETA 는 폴더별이 아니라 전체 코퍼스 row 기준으로 하나만 표시한다.
+    kwargs 는 convert_dataset 에 그대로 넘긴다.
+    """
+    jobs = []
+    for src_path in source_dirs:
+        base_name = os.path.basename(src_path.rstrip("/"))
+        manifest = None if kwargs.get("restart") else load_manifest(os.path.join(target_base, base_name))
+        if manifest and manifest.get("complete"):
+            print(f"[SKIP] '{base_name}' already converted (checkpoint complete)")
+            continue
+        rows, nbytes = parquet_size(find_parquet_files(src_path))
+        if manifest:
+            rows -= committed_rows(manifest)
+        jobs.append((nbytes, rows, src_path))
+    jobs.sort(key=lambda job: job[0], reverse=True)  # 큰 폴더부터
+
+    total_rows = sum(rows for _, rows, _ in jobs)
+    total_bytes = sum(nbytes for nbytes, _, _ in jobs)
+    print(f"[PLAN] {len(jobs)} datasets, {total_rows:,} rows, {total_bytes / 2**30:.1f} GiB "
+          f"({concurrent} at a time, {workers} workers)")
+
+    failed = []
+    with (ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()) as executor, \
+            ThreadPoolExecutor(max_workers=max(concurrent, 1)) as threads, \
+            tqdm(total=total_rows, unit="rows", desc="OneVisionData", smoothing=0.05) as progress:
+        futures = {
+            threads.submit(convert_dataset, src_path, target_base, workers,
+                           executor=executor, progress=progress, **kwargs): src_path
+            for _, _, src_path in jobs
+        }
+        for fut in as_completed(futures):
+            try:
+                fut.result()
+            except Exception as e:  # 한 폴더가 실패해도 나머지는 계속 변환
+                print(f"[FAIL] '{os.path.basename(futures[fut])}': {e!r}")
+                failed.append(futures[fut])
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} datasets failed: {[os.path.basename(p) for p in failed]}")
 
 
 def main():
@@ -125,27 +211,101 @@ def main():
         help="변환 결과를 저장할 폴더 경로",
     )
     parser.add_argument(
-        "--cache-dir",
-        default="/mnt/ssd/junha/.cache/huggingface",
-        help="HuggingFace Dataset 캐시 디렉토리",
+        "--workers",
+        type=int,
+        default=1,
+        help="이미지 디코딩/저장 프로세스 수 (모든 데이터셋이 공유하는 전체 예산)",
+    )
+    parser.add_argument(
+        "--concurrent-datasets",
+        type=int,
+        default=1,
+        help="동시에 변환할 데이터셋 폴더 수 (큰 폴더부터 스케줄)",
+    )
+    parser.add_argument(
+        "--passthrough",
+        action="store_true",
+        help="이미 baseline RGB JPEG 인 이미지는 재인코딩 없이 그대로 복사",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=FORMATS,
+        default="json",
+        help="출력 형식: json 배열 또는 jsonl",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="JSON 을 indent 없이 compact 하게 저장",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="체크포인트를 무시하고 모든 폴더를 처음부터 다시 변환",
+    )
+    parser.add_argument(
+        "--image-layout",
+        choices=IMAGE_LAYOUTS,
+        default="flat",
+        help="이미지 저장 방식: flat, hashed 서브디렉토리, tar shard + offset 인덱스",
+    )
+    parser.add_argument(
+        "--shard-size-mb",
+        type=int,
+        default=DEFAULT_SHARD_SIZE >> 20,
+        help="--image-layout tar 의 shard 최대 크기 (MB)",
+    )
+    parser.add_argument(
+        "--writer-threads",
+        type=int,
+        default=0,
+        help="flat/hashed 이미지를 저장할 write-behind 스레드 수 (0 이면 worker 가 직접 저장)",
+    )
+    parser.add_argument(
+        "--write-buffer-mb",
+        type=int,
+        default=DEFAULT_WRITE_BUFFER >> 20,
+        help="write-behind 가 메모리에 쥐고 있을 최대 이미지 크기 (MB, 데이터셋별)",
+    )
+    parser.add_argument(
+        "--durable",
+        action="store_true",
+        help="데이터셋 끝에서 이미지와 디렉토리를 fsync 한 뒤 완료로 표시",
     )
     args = parser.parse_args()
 
     # 타겟 루트 만들기
     os.makedirs(args.target_root, exist_ok=True)
 
+    source_dirs = []
     for entry in sorted(os.listdir(args.source_root)):
         src_path = os.path.join(args.source_root, entry)
         # .cache 같은 폴더는 스킵
         if entry.startswith(".") or not os.path.isdir(src_path):
             continue
-        # 이미 변환된 폴더 스킵
+        # 체크포인트 없이 이미 변환된 폴더 스킵
+        # (체크포인트가 있으면 convert_dataset 이 완료 여부를 보고 스킵하거나 이어서 변환)
         target_folder = os.path.join(args.target_root, entry)
-        if os.path.exists(target_folder):
+        if os.path.exists(target_folder) and load_manifest(target_folder) is None and not args.restart:
             print(f"[SKIP] '{entry}' already exists in target directory")
             continue
+        source_dirs.append(src_path)
 
-        convert_dataset(src_path, args.target_root, args.cache_dir)
+    convert_all(
+        source_dirs,
+        args.target_root,
+        workers=args.workers,
+        concurrent=args.concurrent_datasets,
+        passthrough=args.passthrough,
+        output_format=args.output_format,
+        compact=args.compact,
+        restart=args.restart,
+        image_layout=args.image_layout,
+        shard_size=args.shard_size_mb << 20,
+        writer_threads=args.writer_threads,
+        write_buffer=args.write_buffer_mb << 20,
+        durable=args.durable,
+    )
 
 
 if __name__ == "__main__":
@@ -1,59 +1,44 @@
+#!/usr/bin/env python3
+# ov_mid_data_imagenet2backbone.py
+
+# python ov_mid_data_imagenet2backbone.py \
+#   --src-base /mnt/ssd/junha/dataset_origin/OneVisionMidData \
+#   --dst-base /mnt/ssd/junha/dataset/OneVisionMidData \
+#   --jobs 4 --writer-threads 8
+
 import os
-import shutil
-import tarfile
-from tqdm import tqdm
-from pathlib import Path
-import json
-
-src_base = "/mnt/ssd/junha/dataset_origin/OneVisionMidData"
-dst_base = "/mnt/ssd/junha/dataset/OneVisionMidData"
-
-os.makedirs(dst_base, exist_ok=True)
-
-# OneVisionMidData 내 폴더 목록 가져오기
-folders = [f for f in os.listdir(src_base) if os.path.isdir(os.path.join(src_base, f))]
-
-for folder in folders:
-    src_folder = os.path.join(src_base, folder)
-    dst_folder = os.path.join(dst_base, folder)
-    
-    # 대상 폴더 생성
-    os.makedirs(dst_folder, exist_ok=True)
-    
-    # 폴더 내 파일 처리
-    for file in os.listdir(src_folder):
-        src_path = os.path.join(src_folder, file)
-        
-        if file.endswith('.json'):
-            # JSON 파일 처리 - 이미지 경로 수정 후 저장
-            with open(src_path, 'r') as f:
-                data = json.load(f)
-                
-            # JSON 데이터가 리스트 형태인지 확인
-            if isinstance(data, list):
-                print(f"Processing {file} with {len(data)} items...")
-                for item in tqdm(data, desc=f"Updating image paths in {file}"):
-                    if 'image' in item:
-                        original_path = item['image']
-                        root = os.path.basename(dst_base)
-                        new_path = f"{root}/{folder}/image/{original_path}"
-                        item['image'] = new_path
-            else:
-                print(f"Warning: {file} is not a list. Skipping...")
-            
-            # 수정된 JSON 저장
-            dst_json_path = os.path.join(dst_base, folder, file)
-            with open(dst_json_path, 'w') as f:
-                json.dump(data, f, indent=2)
-            print(f"Processed and saved {file} to {dst_base}")
-            
-        elif 'images_' in file and file.endswith('.tar.gz'):
-            # 이미지 압축 파일은 image 폴더에 압축 해제
-            image_dir = os.path.join(dst_folder, "image")
-            os.makedirs(image_dir, exist_ok=True)
-            
-            with tarfile.open(src_path, 'r:gz') as tar:
-                tar.extractall(path=image_dir)
-            print(f"Extracted {file} to {image_dir}")
-
-print("All files processed successfully!")
\ No newline at end of file
+import argparse
+
+from tar_extract import DEFAULT_JOBS, DEFAULT_WRITER_THREADS, IMAGE_LAYOUTS, stage_folders
+from write_behind import DEFAULT_WRITE_BUFFER
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="OneVisionMidData 폴더의 json 이미지 경로를 고치고 images_*.tar.gz 를 image/ 에 풉니다."
+    )
+    parser.add_argument("--src-base", default="/mnt/ssd/junha/dataset_origin/OneVisionMidData")
+    parser.add_argument("--dst-base", default="/mnt/ssd/junha/dataset/OneVisionMidData")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help="동시에 압축 해제할 archive 수 (모든 폴더 통틀어)")
+    parser.add_argument("--writer-threads", type=int, default=DEFAULT_WRITER_THREADS,
+                        help="archive 당 파일 쓰기 스레드 수")
+    parser.add_argument("--write-buffer-mb", type=int, default=DEFAULT_WRITE_BUFFER >> 20,
+                        help="archive 당 아직 안 쓴 파일을 메모리에 쥐고 있을 최대 크기 (MB)")
+    parser.add_argument("--force", action="store_true",
+                        help="manifest / 이미 풀린 파일을 무시하고 모든 archive 를 처음부터 다시 풂")
+    parser.add_argument("--image-layout", choices=IMAGE_LAYOUTS, default="flat",
+                        help="flat: image/ 에 낱개 파일로 풀기, "
+                             "tar: archive 마다 인덱스 붙은 비압축 tar 로 묶기 (indexed_tar.read_image_bytes 로 읽음)")
+    args = parser.parse_args()
+
+    # OneVisionMidData 내 폴더 목록 가져오기
+    folders = [f for f in os.listdir(args.src_base) if os.path.isdir(os.path.join(args.src_base, f))]
+
+    stage_folders(args.src_base, args.dst_base, folders, args.jobs, args.writer_threads,
+                  args.write_buffer_mb << 20, args.force, args.image_layout)
+    print("All files processed successfully!")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,20 +6,27 @@ JSON + image-directory format LLaVA-NeXT uses.
 
 Example:
     python parquet2json-image.py /mnt/ssd/junha/dataset_origin/ReCap-118K recap118k.json
-    python parquet2json-image.py /mnt/ssd/junha/dataset_origin/ReCap-118K recap118k.json
+    python parquet2json-image.py /mnt/ssd/junha/dataset_origin/ReCap-118K recap118k.json --workers 16
 """
 
-import argparse, glob, json, os, csv
-from io import BytesIO
-from datasets import load_dataset, Image as HFImage
-from tqdm import tqdm
-from PIL import Image, UnidentifiedImageError
+import argparse, glob, os
+
+from convert_engine import convert_parquet, format_stage_report, write_bad_samples
+from convert_utils import DEFAULT_WRITE_BUFFER, IMAGE_LAYOUTS
+from convert_checkpoint import ConvertCheckpoint
+from indexed_tar import DEFAULT_SHARD_SIZE
+from json_stream import FORMATS, output_path
 
-def convert_dataset(source_root: str, json_name: str) -> None:
+def convert_dataset(source_root: str, json_name: str, workers: int = 1, passthrough: bool = False,
+                    output_format: str = "json", compact: bool = False, restart: bool = False,
+                    image_layout: str = "flat", shard_size: int = DEFAULT_SHARD_SIZE,
+                    writer_threads: int = 0, write_buffer: int = DEFAULT_WRITE_BUFFER,
+                    durable: bool = False, target_base: str = "/mnt/ssd/junha/dataset"):
+    """변환 결과 폴더는 {target_base}/{base_name}. convert_parquet 의 결과 dict 를 반환."""
     source_root = os.path.abspath(source_root)
     base_name  = os.path.basename(source_root)          # e.g. ReCap-118K
 
-    target_root = os.path.join("/mnt/ssd/junha/dataset", base_name)
+    target_root = os.path.join(target_base, base_name)
     image_dir   = os.path.join(target_root, "image")
     os.makedirs(image_dir, exist_ok=True)
 
@@ -27,69 +34,69 @@ def convert_dataset(source_root: str, json_name: str) -> None:
     if not parquet_files:
         raise FileNotFoundError(f"No parquet files in {os.path.join(source_root,'data')}")
 
-    # ── 1) 자동 디코딩 끄기 ─────────────────────────────────────────────
-    ds = load_dataset(
-        "parquet",
-        data_files={"train": parquet_files},
-        split="train",
-        cache_dir="/mnt/ssd/junha/.cache/huggingface",
-    ).cast_column("image", HFImage(decode=False))   # ← decode=False!
-
-    converted, bad_samples = [], []                 # bad_samples → CSV로 남김
-
-    for row in tqdm(ds, desc=f"Converting {base_name}"):
-        rec = {"id": row["id"], "conversations": row["conversations"]}
-
-        bytes_ = row["image"]["bytes"] if row.get("image") else None
-        if bytes_:
-            try:
-                img = Image.open(BytesIO(bytes_))
-                img.load()                          # 실제 디코딩
-                if getattr(img, "mode", "RGB") != "RGB":
-                    img = img.convert("RGB")
-                img_filename = f"{row['id']}.jpg"
-                sub_dir = os.path.dirname(img_filename)
-                if sub_dir:
-                    os.makedirs(os.path.join(image_dir, sub_dir), exist_ok=True)
-                rel_path     = os.path.join(base_name, "image", img_filename)
-                rec["image"] = rel_path
-                img.save(os.path.join(image_dir, img_filename))
-
-            # ── 2) 깨진 이미지 건너뛰기 ───────────────────────────────
-            except (UnidentifiedImageError, OSError) as e:
-                bad_samples.append({"id": row["id"], "reason": str(e)})
-                continue
-
-        converted.append(rec)
-
-    # ── 3) JSON 저장 ─────────────────────────────────────────────────
-    if not json_name.endswith(".json"):
-        json_name += ".json"
-    json_path = os.path.join(target_root, json_name)
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(converted, f, indent=4, ensure_ascii=False)
-
-    # ── 4) 깨진 샘플 로그 저장 (ReCap‑CC3M 폴더) ───────────────────────
+    json_path = output_path(os.path.join(target_root, json_name), output_format)
+
+    # 체크포인트: 이전 실행이 중단됐으면 커밋된 row group 다음부터 이어서 변환
+    options = {"json_path": json_path, "output_format": output_format,
+               "compact": compact, "passthrough": passthrough,
+               "image_layout": image_layout, "shard_size": shard_size}
+    ckpt = ConvertCheckpoint(target_root, parquet_files, options, restart=restart)
+    if ckpt.complete:
+        print(f"||   {base_name} already converted (checkpoint complete), use --restart to redo")
+        return
+    if ckpt.resuming:
+        print(f"||   Resuming {base_name}: {ckpt.rows_done:,} rows already committed")
+
+    # ── 1) read → encode → write 파이프라인으로 변환 (convert_engine) ────
+    #      parquet 은 row group 단위로 직접 읽고 (HF 캐시 미사용),
+    #      레코드는 만들어지는 대로 JSON 파일에 바로 씀 (메모리에 모으지 않음)
+    #      깨진 이미지는 건너뛰고 bad_samples 로 모음
+    result = convert_parquet(parquet_files, ckpt, json_path, image_dir, os.path.join(base_name, "image"),
+                             output_format=output_format, indent=None if compact else 4,
+                             image_layout=image_layout, shard_size=shard_size,
+                             workers=workers, passthrough=passthrough,
+                             writer_threads=writer_threads, write_buffer=write_buffer, durable=durable,
+                             desc=f"Converting {base_name}")
+    bad_samples = result["bad_samples"]             # bad_samples → CSV로 남김
+
+    # ── 2) 깨진 샘플 로그 저장 (ReCap‑CC3M 폴더) ───────────────────────
     if bad_samples:
-        bed_root = os.path.join("/mnt/ssd/junha/dataset", base_name)
-        log_path = os.path.join(bed_root, f"{base_name}_bad_samples.csv")
-        with open(log_path, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = ["id", "reason"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(bad_samples)
+        log_path = os.path.join(target_root, f"{base_name}_bad_samples.csv")
+        write_bad_samples(log_path, bad_samples)
         print(f"||   {len(bad_samples):,} bad samples logged to {log_path}")
 
-    print(f"||   Done. {len(converted):,} good samples saved to {json_path}")
+    print(f"||   Done. {result['count']:,} good samples saved to {json_path}")
     print(f"||   Images written to {image_dir}")
+    print(f"||   {format_stage_report(result)}")
+    return result
 
 # ── main 그대로 ──────────────────────────────────────────────────────
 def main():
     parser = argparse.ArgumentParser(description="Convert parquet dataset folder to LLaVA-NeXT json+image format.")
     parser.add_argument("dataset_folder", help="Source dataset folder path (e.g. /mnt/ssd/...)")
     parser.add_argument("json_name",      help="Output JSON filename (e.g. recap118k.json)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for image decode/encode")
+    parser.add_argument("--passthrough", action="store_true",
+                        help="Copy images that are already baseline RGB JPEGs without re-encoding")
+    parser.add_argument("--output-format", choices=FORMATS, default="json",
+                        help="Write a JSON array or JSONL")
+    parser.add_argument("--compact", action="store_true", help="Write JSON without indentation")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and convert from scratch")
+    parser.add_argument("--image-layout", choices=IMAGE_LAYOUTS, default="flat",
+                        help="flat image/ dir, hashed subdirectories, or indexed tar shards")
+    parser.add_argument("--shard-size-mb", type=int, default=DEFAULT_SHARD_SIZE >> 20,
+                        help="Max shard size for --image-layout tar (MB)")
+    parser.add_argument("--writer-threads", type=int, default=0,
+                        help="Write flat/hashed images from a write-behind thread pool (0 = workers write directly)")
+    parser.add_argument("--write-buffer-mb", type=int, default=DEFAULT_WRITE_BUFFER >> 20,
+                        help="Max encoded image bytes held in memory by the write-behind pool (MB)")
+    parser.add_argument("--durable", action="store_true",
+                        help="fsync images and directories before marking the dataset complete")
     args = parser.parse_args()
-    convert_dataset(args.dataset_folder, args.json_name)
+    convert_dataset(args.dataset_folder, args.json_name, args.workers, args.passthrough,
+                    args.output_format, args.compact, args.restart,
+                    args.image_layout, args.shard_size_mb << 20,
+                    args.writer_threads, args.write_buffer_mb << 20, args.durable)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,7 +1,13 @@
+import argparse
 import json
+import os
 import random
 from tqdm import tqdm
 
+from file_cache import ResultCache, default_cache_path, fingerprint, is_unchanged, stat_matches
+
+CACHE_VERSION = 1  # 프롬프트 목록 / 치환 규칙이 바뀌면 올려서 캐시를 무효화
+
 RANDOM_PROMPTS = [
     "What is in the photo?",
     "Share a interpretation of the image provided.",
@@ -12,9 +18,11 @@ RANDOM_PROMPTS = [
 ]
 
 def append_prompt_to_json(input_path, output_path):
+    """human 대화가 '<image>' 뿐인 곳에 프롬프트를 붙여 output_path 에 저장. 바꾼 대화 수를 반환."""
     with open(input_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
+    replaced = 0
     for item in tqdm(data, desc="Processing items"):
         for conv in item.get("conversations", []):
             if conv.get("from") == "human" and conv.get("value") == "<image>":
@@ -23,13 +31,51 @@ def append_prompt_to_json(input_path, output_path):
                 else:
                     prompt = random.choice(RANDOM_PROMPTS)
                 conv["value"] = "<image>\n" + prompt
+                replaced += 1
 
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
+    return replaced
+
+
+def append_prompt_cached(input_path, output_path, cache):
+    """
+    input 이 지난번과 같고 (크기/mtime, 시각만 바뀌었으면 내용 해시) 그때 만든 output 도
+    손대지 않은 채 그대로 있으면 다시 만들지 않는다. 이번에 처리했으면 True.
+    """
+    entry = cache.get(input_path)
+    if entry is not None:
+        out = entry["result"]
+        if (out["output"] == os.path.abspath(output_path) and stat_matches(output_path, out)
+                and is_unchanged(input_path, entry)):
+            print(f"[CACHE] {input_path} unchanged since the last run, {output_path} is up to date")
+            if not stat_matches(input_path, entry):  # 시각만 바뀐 경우 다음엔 stat 만으로 끝나게
+                cache.put(input_path, fingerprint(input_path, entry["hash"]), out)
+                cache.save()
+            return False
+
+    replaced = append_prompt_to_json(input_path, output_path)
+    st = os.stat(output_path)
+    cache.put(input_path, fingerprint(input_path), {
+        "output": os.path.abspath(output_path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "replaced": replaced,
+    })
+    cache.save()
+    return True
+
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 3:
-        print("Usage: python append_prompt.py input.json output.json")
+    parser = argparse.ArgumentParser(description="ReCap json 의 '<image>' 만 있는 human 대화에 프롬프트를 붙입니다.")
+    parser.add_argument("input", help="input.json")
+    parser.add_argument("output", help="output.json")
+    parser.add_argument("--cache", default=default_cache_path("prompt_adder"),
+                        help="입력 파일별 (크기, mtime, 내용 해시, 결과) 캐시 경로")
+    parser.add_argument("--no-cache", action="store_true", help="캐시를 무시하고 항상 다시 만듦")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        append_prompt_to_json(args.input, args.output)
     else:
-        append_prompt_to_json(sys.argv[1], sys.argv[2])
\ No newline at end of file
+        append_prompt_cached(args.input, args.output, ResultCache(args.cache, version=CACHE_VERSION))
\ No newline at end of file
@@ -0,0 +1,298 @@
+# record_store.py
+"""
+LLaVA 형식 annotation (sft_mmpr_llava_format.json, dpo_mmpr_llava_format.json,
+OneVisionData 의 *.json 등) 을 열 단위 Arrow IPC 파일로 저장하고 mmap 으로 읽는 레코드 저장소.
+
+큰 pretty-printed JSON 배열은 레코드 하나를 보려 해도 전체를 json.load 해야 하지만,
+이 저장소는 파일을 mmap 으로 열기만 하면 되고 (복사 없음)
+  - store.column("similarity") 처럼 열 하나만 훑거나
+  - store.get("some-id") 처럼 id 로 바로 (해시 테이블) 찾거나
+  - store[i] 로 i 번째 레코드를 꺼낼 수 있다.
+
+    python record_store.py pack MMPR-v1.2/dpo_mmpr_llava_format.json dpo.arrow
+    python record_store.py unpack dpo.arrow dpo_mmpr_llava_format.json   # 원래 JSON 과 같은 내용
+    python record_store.py get dpo.arrow coco-000000123-45678
+
+    with RecordStore("dpo.arrow") as store:
+        store.get("coco-000000123-45678")
+        sims = store.column("similarity")   # pyarrow.ChunkedArray (mmap 위의 zero-copy)
+
+파일 구성
+    dpo.arrow       Arrow IPC file (비압축, BATCH_ROWS 행씩 record batch)
+    dpo.arrow.ids   id → 행 번호 해시 테이블 (open addressing, uint64 slot 배열)
+
+열: id, conversations (list<struct<from, value>>), prompt, chosen, rejected, image, data_source,
+similarity (float64). 타입이 맞지 않는 값(e.g. image 가 리스트)이나 그 밖의 키는 extra 열에 JSON 으로,
+키 순서는 keys 열에 넣어 두므로 unpack 결과는 원래 레코드와 키 순서까지 같다.
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from json_stream import JSONStreamWriter, iter_json_array, output_path
+
+BATCH_ROWS = 8192  # 마지막 batch 를 빼면 모두 이 크기 (행 번호 → batch 를 나눗셈으로 찾음)
+IDS_SUFFIX = ".ids"
+IDS_MAGIC = b"RSIDS001"
+IDS_HEADER = struct.Struct("<8sQQ")  # magic, slot 수, 행 수
+KEY_SEP = "\x1f"
+
+TURN = pa.struct([("from", pa.string()), ("value", pa.string())])
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("conversations", pa.list_(TURN)),
+    ("prompt", pa.string()),
+    ("chosen", pa.string()),
+    ("rejected", pa.string()),
+    ("image", pa.string()),
+    ("data_source", pa.string()),
+    ("similarity", pa.float64()),
+    ("extra", pa.string()),
+    ("keys", pa.string()),
+])
+_STRING_FIELDS = ("id", "prompt", "chosen", "rejected", "image", "data_source")
+
+
+def _fits(key, value):
+    """value 를 key 열의 타입 그대로 (손실 없이) 넣을 수 있는지."""
+    if key in _STRING_FIELDS:
+        return isinstance(value, str)
+    if key == "similarity":
+        return type(value) is float
+    if key == "conversations":
+        return isinstance(value, list) and all(
+            isinstance(t, dict) and list(t) == ["from", "value"]
+            and isinstance(t["from"], str) and isinstance(t["value"], str) for t in value)
+    return False
+
+
+def _to_columns(records):
+    cols = {name: [] for name in SCHEMA.names}
+    for rec in records:
+        extra = {}
+        for name in SCHEMA.names[:-2]:
+            value = rec.get(name)
+            if name in rec and _fits(name, value):
+                cols[name].append(value)
+            else:
+                cols[name].append(None)
+        for key, value in rec.items():
+            if not _fits(key, value):
+                extra[key] = value
+        cols["extra"].append(json.dumps(extra, ensure_ascii=False) if extra else None)
+        cols["keys"].append(KEY_SEP.join(rec))
+    return pa.RecordBatch.from_pydict(cols, schema=SCHEMA)
+
+
+def _from_columns(cols, n):
+    """{열 이름: 파이썬 리스트} → 레코드 dict 리스트 (원래 키 순서)."""
+    records = []
+    for i in range(n):
+        extra = json.loads(cols["extra"][i]) if cols["extra"][i] is not None else {}
+        rec = {}
+        for key in cols["keys"][i].split(KEY_SEP) if cols["keys"][i] else ():
+            rec[key] = extra[key] if key in extra else cols[key][i]
+        records.append(rec)
+    return records
+
+
+def _iter_records(src):
+    if src.endswith(".jsonl"):
+        with open(src, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from iter_json_array(src)
+
+
+def _id_hash(record_id):
+    return int.from_bytes(hashlib.blake2b(record_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _build_id_table(ids):
+    """
+    open addressing 해시 테이블. slot = (해시 상위 32bit << 32) | (행 번호 + 1), 0 은 빈 칸.
+    같은 id 가 여러 번 나오면 처음 행만 넣는다.
+    """
+    n_slots = 1
+    while n_slots < 2 * max(len(ids), 1):
+        n_slots <<= 1
+    mask = n_slots - 1
+    slots = [0] * n_slots
+    for row, record_id in enumerate(ids):
+        if record_id is None:
+            continue
+        h = _id_hash(record_id)
+        tag = h >> 32
+        i = h & mask
+        while slots[i]:
+            other = (slots[i] & 0xFFFFFFFF) - 1
+            if slots[i] >> 32 == tag and ids[other] == record_id:
+                break  # 중복 id
+            i = (i + 1) & mask
+        else:
+            slots[i] = (tag << 32) | (row + 1)
+    return slots
+
+
+def pack(src, dst):
+    """JSON 배열 / JSONL → Arrow 저장소 (+ id 해시 테이블). 레코드 수를 반환."""
+    ids = []
+    tmp_path = dst + ".tmp"
+    batch = []
+    with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, SCHEMA) as writer:
+        for rec in _iter_records(src):
+            batch.append(rec)
+            if len(batch) == BATCH_ROWS:
+                rb = _to_columns(batch)
+                ids.extend(rb.column(0).to_pylist())
+                writer.write_batch(rb)
+                batch.clear()
+        if batch:
+            rb = _to_columns(batch)
+            ids.extend(rb.column(0).to_pylist())
+            writer.write_batch(rb)
+
+    slots = _build_id_table(ids)
+    ids_tmp = dst + IDS_SUFFIX + ".tmp"
+    with open(ids_tmp, "wb") as f:
+        f.write(IDS_HEADER.pack(IDS_MAGIC, len(slots), len(ids)))
+        array("Q", slots).tofile(f)
+    os.replace(tmp_path, dst)
+    os.replace(ids_tmp, dst + IDS_SUFFIX)
+    return len(ids)
+
+
+class RecordStore:
+    """
+    pack() 이 만든 저장소를 mmap 으로 연다. 열 데이터는 복사하지 않고 페이지 캐시를 그대로 쓴다.
+
+    store[i]          i 번째 레코드 (dict)
+    store.get(id)     id 의 (처음) 레코드, 없으면 None
+    store.row_of(id)  id 의 행 번호, 없으면 None
+    store.column(c)   열 하나 (pyarrow.ChunkedArray, zero-copy)
+    iter(store)       레코드를 batch 단위로 풀어 차례로
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._source = pa.memory_map(path, "r")
+        self._reader = ipc.open_file(self._source)
+        self.table = self._reader.read_all()  # memory_map 위에서는 zero-copy
+        self._batches = self.table.to_batches()
+        self._ids = [b.column(0) for b in self._batches]
+        with open(path + IDS_SUFFIX, "rb") as f:
+            self._ids_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_slots, n_rows = IDS_HEADER.unpack_from(self._ids_mm, 0)
+        if magic != IDS_MAGIC or n_rows != self.table.num_rows:
+            raise ValueError(f"{path}{IDS_SUFFIX}: not an id table or does not match {path}")
+        self._slots = memoryview(self._ids_mm)[IDS_HEADER.size:IDS_HEADER.size + 8 * n_slots].cast("Q")
+        self._mask = n_slots - 1
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def _batch(self, row):
+        return self._batches[row // BATCH_ROWS], row % BATCH_ROWS
+
+    def _id_at(self, row):
+        return self._ids[row // BATCH_ROWS][row % BATCH_ROWS].as_py()
+
+    def row_of(self, record_id):
+        h = _id_hash(record_id)
+        tag = h >> 32
+        i = h & self._mask
+        while True:
+            slot = self._slots[i]
+            if not slot:
+                return None
+            row = (slot & 0xFFFFFFFF) - 1
+            if slot >> 32 == tag and self._id_at(row) == record_id:
+                return row
+            i = (i + 1) & self._mask
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        batch, i = self._batch(row)
+        return _from_columns({name: [batch.column(name)[i].as_py()] for name in SCHEMA.names}, 1)[0]
+
+    def get(self, record_id):
+        row = self.row_of(record_id)
+        return None if row is None else self[row]
+
+    def column(self, name):
+        return self.table.column(name)
+
+    def __iter__(self):
+        for batch in self._batches:
+            cols = {name: batch.column(name).to_pylist() for name in SCHEMA.names}
+            yield from _from_columns(cols, batch.num_rows)
+
+    def close(self):
+        self.table = self._batches = self._ids = None
+        self._slots.release()
+        self._ids_mm.close()
+        self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def unpack(src, dst, fmt="json", indent=2):
+    """저장소 → JSON 배열 / JSONL (json.dump(records, indent=2, ensure_ascii=False) 와 같은 모양)."""
+    with RecordStore(src) as store, JSONStreamWriter(dst, fmt, indent=indent) as out:
+        for rec in store:
+            out.write(rec)
+    return out.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLaVA 형식 JSON 과 열 단위 mmap 저장소(Arrow IPC) 사이 변환")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_pack = sub.add_parser("pack", help="JSON / JSONL → 저장소")
+    p_pack.add_argument("src")
+    p_pack.add_argument("dst")
+
+    p_unpack = sub.add_parser("unpack", help="저장소 → JSON / JSONL")
+    p_unpack.add_argument("src")
+    p_unpack.add_argument("dst")
+    p_unpack.add_argument("--format", choices=["json", "jsonl"], default="json")
+
+    p_get = sub.add_parser("get", help="id 로 레코드 하나 출력")
+    p_get.add_argument("store")
+    p_get.add_argument("id")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        n = pack(args.src, args.dst)
+        print(f"[DONE] {n:,} records -> {args.dst}")
+    elif args.command == "unpack":
+        dst = output_path(args.dst, args.format)
+        n = unpack(args.src, dst, args.format)
+        print(f"[DONE] {n:,} records -> {dst}")
+    else:
+        with RecordStore(args.store) as store:
+            rec = store.get(args.id)
+        if rec is None:
+            raise SystemExit(f"{args.id} not found")
+        print(json.dumps(rec, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
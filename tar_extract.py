@@ -0,0 +1,432 @@
+# tar_extract.py
+"""
+images_*.tar.gz + annotation JSON 폴더 staging
+(ov_mid_data_imagenet2backbone.py, ov_data_imagenet2backbone-tar.py 공용).
+
+tarfile.extractall 은 gzip 해제와 파일 쓰기를 한 스레드에서 번갈아 하므로 대신
+  - archive 마다 스레드 하나가 스트림('r|gz')으로 gzip 을 풀고 (zlib 은 GIL 을 놓고 돎)
+  - 풀린 member bytes 는 archive 별 WriteBehind 스레드 풀이 동시에 쓴다
+여러 폴더에 걸친 archive 들을 큰 것부터 jobs 개씩 동시에 풀고,
+진행률은 전체 작업의 압축 파일 바이트 기준 (B/s) 으로 하나만 보여 준다.
+
+image_layout="tar" 면 낱개 파일로 풀지 않고 archive 마다 압축만 푼 tar 하나
+(image/images_0.tar + .idx, indexed_tar 참고) 로 다시 묶고, JSON 의 image 를
+"…/image/images_0.tar/{member}" 로 바꾼다. 학습 쪽은 indexed_tar.read_image_bytes 로 읽는다.
+
+다시 돌리면 이어서 푼다.
+  - member 마다 이미 풀린 파일과 크기 / mtime 을 비교해 없거나 달라진 것만 쓴다
+  - 다 푼 archive 는 {dst_folder}/.extract_manifest/{archive}.json 에 기록해 두고,
+    archive 파일 (크기, mtime) 이 그대로면 열지도 않고 건너뛴다
+"""
+
+import json
+import os
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tqdm import tqdm
+
+from indexed_tar import INDEX_SUFFIX, IndexedTarWriter, read_index
+from json_stream import JSONStreamWriter, is_json_array, iter_json_array
+from write_behind import DEFAULT_WRITE_BUFFER, WriteBehind
+
+DEFAULT_JOBS = 4  # 동시에 푸는 archive 수
+DEFAULT_WRITER_THREADS = 8  # archive 당 파일 쓰기 스레드 수
+REAP_EVERY = 1024  # member 이만큼마다 끝난 쓰기 Future 를 치움
+MANIFEST_DIR = ".extract_manifest"
+IMAGE_LAYOUTS = ("flat", "tar")  # 낱개 파일로 풀기 / archive 마다 인덱스 붙은 tar 로 다시 묶기
+
+_progress_lock = threading.Lock()
+
+
+def is_image_archive(name):
+    return "images_" in name and name.endswith(".tar.gz")
+
+
+class _ProgressReader:
+    """압축 파일을 읽은 만큼 공유 tqdm 을 올린다 (여러 archive 스레드가 같이 씀)."""
+
+    def __init__(self, f, progress):
+        self._f = f
+        self._progress = progress
+
+    def read(self, n=-1):
+        data = self._f.read(n)
+        with _progress_lock:
+            self._progress.update(len(data))
+        return data
+
+
+def manifest_path(tar_path, out_dir):
+    """out_dir (…/{folder}/image) 옆의 .extract_manifest/{archive 이름}.json"""
+    return os.path.join(os.path.dirname(os.path.normpath(out_dir)), MANIFEST_DIR,
+                        os.path.basename(tar_path) + ".json")
+
+
+def _archive_stat(tar_path):
+    st = os.stat(tar_path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+def repacked_path(tar_path, out_dir):
+    """images_0.tar.gz → out_dir/images_0.tar"""
+    return os.path.join(out_dir, os.path.basename(tar_path)[:-len(".gz")])
+
+
+def is_extracted(tar_path, out_dir, layout="flat"):
+    """이 archive 가 (바뀌지 않은 채로) out_dir 에 이미 다 풀렸는지 manifest 로만 판단."""
+    try:
+        with open(manifest_path(tar_path, out_dir), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (manifest.get("complete") and manifest.get("out_dir") == os.path.abspath(out_dir)
+            and manifest.get("layout", "flat") == layout
+            and manifest.get("archive") == _archive_stat(tar_path))
+
+
+def _save_manifest(tar_path, out_dir, stats, layout="flat"):
+    path = manifest_path(tar_path, out_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest = {
+        "archive": _archive_stat(tar_path),
+        "out_dir": os.path.abspath(out_dir),
+        "layout": layout,
+        **stats,
+        "complete": True,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+class _ExistingFiles:
+    """
+    member 가 이미 풀려 있는지 확인. 디렉토리마다 listdir 을 한 번만 하고,
+    목록에 있는 이름만 stat 한다 (처음 푸는 경우엔 stat 이 전혀 없음).
+    """
+
+    def __init__(self):
+        self._listing = {}
+
+    def up_to_date(self, path, member):
+        d, name = os.path.split(path)
+        names = self._listing.get(d)
+        if names is None:
+            try:
+                names = self._listing[d] = set(os.listdir(d))
+            except FileNotFoundError:
+                names = self._listing[d] = set()
+        if name not in names:
+            return False
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        # mtime 은 쓰기가 끝난 뒤에 맞추므로, 중간에 끊긴 파일은 여기서 걸러짐
+        return st.st_size == member.size and int(st.st_mtime) == int(member.mtime)
+
+
+def _safe_name(name):
+    """out_dir 밖을 가리키는 member (절대 경로, ..) 는 풀지 않는다."""
+    norm = os.path.normpath(name)
+    return not (os.path.isabs(norm) or norm == ".." or norm.startswith(".." + os.sep))
+
+
+def _link_target(member):
+    """
+    링크 member 가 가리키는 archive 안 경로 (normpath). out_dir 밖을 가리키면 None.
+    hard link 의 linkname 은 archive 기준, symlink 는 링크가 있는 디렉토리 기준.
+    """
+    if member.islnk():
+        target = member.linkname
+    elif os.path.isabs(member.linkname):
+        return None
+    else:
+        target = os.path.join(os.path.dirname(member.name), member.linkname)
+    target = os.path.normpath(target)
+    return target if _safe_name(target) else None
+
+
+def _make_link(path, make):
+    """path 에 있던 것 (이전 실행의 링크 / 파일) 을 지우고 make() 로 링크를 만든다."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    make()
+
+
+def extract_archive(tar_path, out_dir, writer_threads=DEFAULT_WRITER_THREADS,
+                    write_buffer=DEFAULT_WRITE_BUFFER, progress=None, force=False):
+    """
+    tar_path 를 out_dir 에 풀고 {"members", "bytes", "skipped", "links"} (쓴 파일 수 / 바이트,
+    이미 같은 크기·mtime 으로 있어서 건너뛴 파일 수, 만든 링크 수) 를 반환. 끝나면 manifest 를 남긴다.
+    force=True 면 이미 있는 파일도 모두 다시 쓴다.
+
+    스트림에서는 tar.extract 로 링크를 풀 수 없으므로 (hard link 대상을 다시 읽으려고 뒤로 seek 함)
+    symlink 는 바로 만들고, hard link 는 모든 파일 쓰기가 끝난 뒤 이미 풀린 대상에 os.link 한다.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    members = nbytes = skipped = links = 0
+    hardlinks = []  # (대상 경로, 링크 경로)
+    existing = _ExistingFiles()
+    with open(tar_path, "rb") as raw, WriteBehind(writer_threads, write_buffer) as wb:
+        src = raw if progress is None else _ProgressReader(raw, progress)
+        with tarfile.open(fileobj=src, mode="r|gz") as tar:
+            for member in tar:
+                if not _safe_name(member.name):
+                    print(f"[WARN] {os.path.basename(tar_path)}: skipping unsafe member {member.name!r}")
+                    continue
+                path = os.path.join(out_dir, member.name)
+                if member.isfile():
+                    if not force and existing.up_to_date(path, member):
+                        skipped += 1  # 데이터는 읽지 않고 다음 member 로 (스트림이 건너뜀)
+                        continue
+                    wb.submit(path, tar.extractfile(member).read(), member.mtime)
+                    members += 1
+                    nbytes += member.size
+                    if members % REAP_EVERY == 0:
+                        wb.reap()
+                elif member.isdir():
+                    os.makedirs(path, exist_ok=True)
+                elif member.issym() or member.islnk():
+                    target = _link_target(member)
+                    if target is None:
+                        print(f"[WARN] {os.path.basename(tar_path)}: skipping link {member.name!r} "
+                              f"→ {member.linkname!r} (points outside the archive)")
+                    elif member.issym():
+                        _make_link(path, lambda: os.symlink(member.linkname, path))
+                        links += 1
+                    else:
+                        hardlinks.append((os.path.join(out_dir, target), path))
+                else:
+                    print(f"[WARN] {os.path.basename(tar_path)}: skipping special member {member.name!r}")
+        wb.flush()
+    for target, path in hardlinks:
+        if not os.path.isfile(target):
+            print(f"[WARN] {os.path.basename(tar_path)}: hard link target {target} was not extracted, "
+                  f"skipping {path}")
+            continue
+        _make_link(path, lambda: os.link(target, path))
+        links += 1
+    stats = {"members": members, "bytes": nbytes, "skipped": skipped, "links": links}
+    _save_manifest(tar_path, out_dir, stats)  # 모든 쓰기가 끝난 뒤에만 완료로 기록
+    return stats
+
+
+def _resolve_aliases(links, entries):
+    """
+    links: {링크 이름: 가리키는 이름}, entries: {이름: (offset, size)} (tar 에 담은 파일).
+    링크 → 링크 로 이어진 것도 따라가서 파일에 닿는 링크만 {링크 이름: (offset, size)} 로.
+    """
+    resolved = {}
+    for name in links:
+        target, seen = links[name], {name}
+        while target in links and target not in seen:
+            seen.add(target)
+            target = links[target]
+        if target in entries:
+            resolved[name] = entries[target]
+    return resolved
+
+
+def repack_archive(tar_path, out_dir, progress=None):
+    """
+    tar_path (images_0.tar.gz) 를 out_dir/images_0.tar + .idx 로 다시 묶는다.
+    member 이름은 normpath 한 원래 경로 그대로, 일반 파일만 tar 에 담고 mtime 도 원래 값을 쓴다.
+    hard link / symlink member 는 인덱스에만 대상 파일의 (offset, size) 로 넣는다
+    (대상이 archive 에 없거나 밖을 가리키면 경고하고 stats 의 "skipped_links" 로 셈).
+    tar 하나에 순서대로 이어 쓰므로 이어서 하기 없이 매번 처음부터 쓴다.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    members = nbytes = 0
+    entries = {}  # 이름 → (offset, size)
+    links = {}  # 링크 이름 → 가리키는 이름
+    name = os.path.basename(tar_path)
+    writer = IndexedTarWriter(repacked_path(tar_path, out_dir))
+    try:
+        with open(tar_path, "rb") as raw:
+            src = raw if progress is None else _ProgressReader(raw, progress)
+            with tarfile.open(fileobj=src, mode="r|gz") as tar:
+                for member in tar:
+                    if not (member.isfile() or member.issym() or member.islnk()):
+                        continue
+                    if not _safe_name(member.name):
+                        print(f"[WARN] {name}: skipping unsafe member {member.name!r}")
+                        continue
+                    member_name = os.path.normpath(member.name)
+                    if member.isfile():
+                        entries[member_name] = writer.add(member_name, tar.extractfile(member).read(),
+                                                          member.mtime)
+                        members += 1
+                        nbytes += member.size
+                    else:
+                        links[member_name] = _link_target(member)
+        aliases = _resolve_aliases(links, entries)
+        for link_name in links:  # archive 순서대로
+            if link_name in aliases:
+                writer.add_alias(link_name, *aliases[link_name])
+            else:
+                print(f"[WARN] {name}: skipping link {link_name!r} (target is not a file in the archive)")
+        writer.sync()
+    finally:
+        writer.close()
+    stats = {"members": members, "bytes": nbytes, "skipped": 0,
+             "links": len(aliases), "skipped_links": len(links) - len(aliases)}
+    _save_manifest(tar_path, out_dir, stats, layout="tar")
+    return stats
+
+
+def load_member_map(image_dir):
+    """image_dir 의 *.tar.idx 를 모두 읽어 {member 이름: tar 파일 이름} 을 만든다."""
+    members = {}
+    for file in sorted(os.listdir(image_dir)):
+        if file.endswith(".tar" + INDEX_SUFFIX):
+            tar_name = file[:-len(INDEX_SUFFIX)]
+            members.update(dict.fromkeys(read_index(os.path.join(image_dir, tar_name)), tar_name))
+    return members
+
+
+def extract_archives(jobs, max_workers=DEFAULT_JOBS, writer_threads=DEFAULT_WRITER_THREADS,
+                     write_buffer=DEFAULT_WRITE_BUFFER, desc="Extracting", force=False, layout="flat"):
+    """
+    jobs: [(tar_path, out_dir), ...]. 큰 archive 부터 max_workers 개씩 동시에 푼다.
+    layout="tar" 면 풀지 않고 repack_archive 로 다시 묶는다.
+    manifest 상 이미 다 풀린 archive 는 건너뛴다 (force=True 면 전부 다시 풂).
+    한 archive 가 실패해도 나머지는 계속 풀고, 끝난 뒤 실패가 있으면 RuntimeError.
+    """
+    if layout not in IMAGE_LAYOUTS:
+        raise ValueError(f"Unknown image layout: {layout!r} (expected one of {IMAGE_LAYOUTS})")
+    if not force:
+        done = [job for job in jobs if is_extracted(*job, layout)]
+        for tar_path, out_dir in done:
+            print(f"[SKIP] {os.path.basename(tar_path)} already extracted to {out_dir}")
+        jobs = [job for job in jobs if job not in done]
+    jobs = sorted(jobs, key=lambda job: os.path.getsize(job[0]), reverse=True)
+    total = sum(os.path.getsize(tar_path) for tar_path, _ in jobs)
+    written = 0
+    failed = []
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool, \
+            tqdm(total=total, unit="B", unit_scale=True, unit_divisor=1024, desc=desc,
+                 smoothing=0.05) as progress:
+        def submit(tar_path, out_dir):
+            if layout == "tar":
+                return pool.submit(repack_archive, tar_path, out_dir, progress)
+            return pool.submit(extract_archive, tar_path, out_dir, writer_threads, write_buffer,
+                               progress, force)
+
+        futures = {submit(tar_path, out_dir): (tar_path, out_dir) for tar_path, out_dir in jobs}
+        for fut in as_completed(futures):
+            tar_path, out_dir = futures[fut]
+            try:
+                stats = fut.result()
+            except Exception as e:
+                progress.write(f"[FAIL] {tar_path}: {e!r}")
+                failed.append(tar_path)
+                continue
+            written += stats["bytes"]
+            if layout == "tar":
+                progress.write(f"Repacked {os.path.basename(tar_path)} to "
+                               f"{repacked_path(tar_path, out_dir)} ({stats['members']:,} files, "
+                               f"{stats['links']:,} links, {stats['skipped_links']:,} links skipped)")
+            else:
+                progress.write(f"Extracted {os.path.basename(tar_path)} to {out_dir} "
+                               f"({stats['members']:,} files written, "
+                               f"{stats['skipped']:,} already up to date)")
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"[DONE] {len(jobs)} archives: {total / 2**20:,.0f} MB compressed → "
+          f"{written / 2**20:,.0f} MB written in {elapsed:.0f}s "
+          f"({total / 2**20 / elapsed:.1f} MB/s in, {written / 2**20 / elapsed:.1f} MB/s out)")
+    if failed:
+        raise RuntimeError(f"{len(failed)} archives failed: {[os.path.basename(p) for p in failed]}")
+
+
+def rewrite_image_paths(src_path, dst_path, prefix, members=None):
+    """
+    annotation JSON (리스트) 의 item['image'] 앞에 prefix 를 붙여 dst_path 에 저장.
+    원소를 하나씩 읽고 바로 써서 메모리는 파일 크기와 무관하다.
+    결과는 json.dump(data, f, indent=2) 와 같은 bytes.
+    members: load_member_map() 결과. 주어지면 "{prefix}/{tar 파일}/{member}" 로 바꾼다
+             (어느 tar 에도 없는 이미지는 원래처럼 "{prefix}/{image}" 로 두고 개수만 알림).
+    """
+    file = os.path.basename(src_path)
+    if not is_json_array(src_path):
+        print(f"Warning: {file} is not a list. Skipping...")
+        with open(src_path, 'r') as f:
+            data = json.load(f)
+        with open(dst_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return
+
+    # 임시 파일에 쓰고 끝나면 교체 (중간에 끊겨도 반쯤 쓴 JSON 이 남지 않음)
+    tmp_path = dst_path + ".tmp"
+    missing = 0
+    with tqdm(total=os.path.getsize(src_path), unit="B", unit_scale=True, unit_divisor=1024,
+              desc=f"Updating image paths in {file}") as progress, \
+            JSONStreamWriter(tmp_path, "json", indent=2, ensure_ascii=True) as out:
+        for item in iter_json_array(src_path, progress=progress):
+            if 'image' in item:
+                image = item['image']
+                if members is not None:
+                    name = os.path.normpath(image)
+                    tar_name = members.get(name)
+                    if tar_name is None:
+                        missing += 1
+                    else:
+                        image = f"{tar_name}/{name}"
+                item['image'] = f"{prefix}/{image}"
+            out.write(item)
+    os.replace(tmp_path, dst_path)
+    print(f"Processed and saved {file} ({out.count:,} items) to {os.path.dirname(dst_path)}")
+    if missing:
+        print(f"[WARN] {file}: {missing:,} images not found in any repacked tar")
+
+
+def stage_folders(src_base, dst_base, folders, jobs=DEFAULT_JOBS, writer_threads=DEFAULT_WRITER_THREADS,
+                  write_buffer=DEFAULT_WRITE_BUFFER, force=False, image_layout="flat"):
+    """
+    src_base/{folder} 의 *.json 은 image 경로를 "{dst_base 이름}/{folder}/image/…" 로 바꿔 저장하고,
+    images_*.tar.gz 는 dst_base/{folder}/image/ 에 푼다 (image_layout="tar" 면 인덱스 tar 로 묶음).
+    flat 은 압축 해제를 백그라운드 스레드들이 모든 폴더에 걸쳐 동시에 하고, 그동안 JSON 을 처리한다.
+    tar 는 JSON 경로에 tar 이름이 들어가므로 다시 묶기가 모두 끝난 뒤 JSON 을 처리한다.
+    """
+    os.makedirs(dst_base, exist_ok=True)
+    root = os.path.basename(dst_base.rstrip("/"))
+
+    json_jobs, archives = [], []
+    for folder in folders:
+        src_folder = os.path.join(src_base, folder)
+        dst_folder = os.path.join(dst_base, folder)
+        os.makedirs(dst_folder, exist_ok=True)
+        for file in sorted(os.listdir(src_folder)):
+            src_path = os.path.join(src_folder, file)
+            if file.endswith('.json'):
+                json_jobs.append((src_path, os.path.join(dst_folder, file), f"{root}/{folder}/image"))
+            elif is_image_archive(file):
+                archives.append((src_path, os.path.join(dst_folder, "image")))
+
+    if image_layout == "tar":
+        extract_archives(archives, jobs, force=force, layout="tar")
+        member_maps = {}
+        for src_path, dst_path, prefix in json_jobs:
+            image_dir = os.path.join(os.path.dirname(dst_path), "image")
+            if image_dir not in member_maps:
+                member_maps.clear()  # 폴더 하나 분량만 메모리에
+                member_maps[image_dir] = load_member_map(image_dir) if os.path.isdir(image_dir) else {}
+            rewrite_image_paths(src_path, dst_path, prefix, member_maps[image_dir])
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as background:
+        extraction = background.submit(extract_archives, archives, jobs, writer_threads, write_buffer,
+                                       force=force)
+        for src_path, dst_path, prefix in json_jobs:
+            rewrite_image_paths(src_path, dst_path, prefix)
+        extraction.result()
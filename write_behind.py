@@ -0,0 +1,105 @@
+# write_behind.py
+"""
+파일 bytes 를 스레드 풀로 비동기 저장하는 write-behind writer.
+
+NFS 처럼 파일 하나 만들 때마다 왕복 지연이 큰 타겟에서 작은 파일(이미지)을 많이 쓸 때,
+쓰는 쪽(인코딩 / tar 압축 해제)을 막지 않고 여러 파일을 동시에 쓴다.
+parquet 변환기(convert_utils.ImageSink)와 tar 압축 해제(tar_extract)가 같이 쓴다.
+
+    wb = WriteBehind(threads=16, max_bytes=256 << 20)
+    for path, data in files:
+        wb.submit(path, data)
+    wb.flush(durable=True)
+    wb.close()
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WRITE_BUFFER = 256 << 20  # 아직 안 쓴 bytes 를 메모리에 쥐고 있을 최대 크기
+
+
+class WriteBehind:
+    """
+    - 아직 디스크에 안 쓴 bytes 가 max_bytes 를 넘으면 submit() 이 자리가 날 때까지 기다린다
+    - 디렉토리는 처음 보는 것만 한 번 만들고 기억해 둔다 (파일마다 makedirs 하지 않음)
+    - mark() 는 지난 mark() 이후 submit 한 쓰기들의 Future 목록 (체크포인트 커밋 시점 판단용)
+    - flush(durable=True) 는 남은 쓰기를 기다린 뒤 os.sync() 와 디렉토리 fsync 로 디스크까지 내림
+
+    submit() / mark() / reap() 는 한 스레드에서만 부른다고 가정한다.
+    """
+
+    def __init__(self, threads=16, max_bytes=DEFAULT_WRITE_BUFFER):
+        self.max_bytes = max_bytes
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="write-behind")
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._dirs = set()
+        self._dir_lock = threading.Lock()
+        self._batch = []
+
+    def _ensure_dir(self, d):
+        if d in self._dirs:
+            return
+        with self._dir_lock:
+            if d not in self._dirs:
+                os.makedirs(d, exist_ok=True)
+                self._dirs.add(d)
+
+    def _write(self, path, data, mtime):
+        try:
+            self._ensure_dir(os.path.dirname(path))
+            with open(path, "wb") as f:
+                f.write(data)
+            if mtime is not None:
+                os.utime(path, (mtime, mtime))
+        finally:
+            with self._cond:
+                self._inflight -= len(data)
+                self._cond.notify_all()
+
+    def submit(self, path, data, mtime=None):
+        """path 에 data 를 쓰도록 예약. mtime 이 주어지면 쓴 뒤 파일 시각을 맞춘다."""
+        with self._cond:
+            # 하나도 안 떠 있으면 예산보다 큰 파일이라도 받아 줌
+            while self._inflight and self._inflight + len(data) > self.max_bytes:
+                self._cond.wait()
+            self._inflight += len(data)
+        self._batch.append(self._pool.submit(self._write, path, data, mtime))
+
+    def mark(self):
+        batch, self._batch = self._batch, []
+        return batch
+
+    def reap(self):
+        """이미 끝난 쓰기를 목록에서 치운다 (파일 수가 아주 많을 때 Future 가 쌓이지 않게)."""
+        pending = []
+        for fut in self._batch:
+            if fut.done():
+                fut.result()  # 실패한 쓰기가 있으면 여기서 올라감
+            else:
+                pending.append(fut)
+        self._batch = pending
+
+    def flush(self, durable=False):
+        """지금까지 submit 한 쓰기를 모두 기다린다. 실패한 쓰기가 있으면 그 예외를 올린다."""
+        for fut in self.mark():
+            fut.result()
+        if durable:
+            os.sync()
+            for d in sorted(self._dirs):
+                fd = os.open(d, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()